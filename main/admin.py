@@ -1,12 +1,41 @@
 from django.contrib import admin
+from . import cache
 from . import models
 
 # Register your models here.
 
 
+# Bumps the response cache versions on admin writes
+class VersionedAdmin(admin.ModelAdmin):
+    cache_versions = ("product", "brand", "category")
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        cache.bump(*self.cache_versions)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        cache.bump(*self.cache_versions)
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        cache.bump(*self.cache_versions)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        cache.bump(*self.cache_versions)
+
+
 admin.site.register(models.Customer)
-admin.site.register(models.Product)
-admin.site.register(models.Category)
-admin.site.register(models.Brand)
-admin.site.register(models.ProductTag)
-admin.site.register(models.Review)
+admin.site.register(models.Product, VersionedAdmin)
+admin.site.register(models.Category, VersionedAdmin)
+admin.site.register(models.Brand, VersionedAdmin)
+admin.site.register(models.BrandStats, VersionedAdmin)
+admin.site.register(models.ProductTag, VersionedAdmin)
+admin.site.register(models.Review, VersionedAdmin)
+admin.site.register(models.CacheVersion)
+admin.site.register(models.StorageCleanupJob)
+admin.site.register(models.LinkAnalysisRun)
+admin.site.register(models.LinkCheck)
+admin.site.register(models.LinkCheckHistory)
+admin.site.register(models.Job)
@@ -0,0 +1,120 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from . import cache, documents, exports, models, serializers, views
+
+renderer = JSONRenderer()
+
+
+# Async public reads for the ASGI deployment (ASYNC_VIEWS)
+#
+# Plain Django coroutine views: a request waiting on Postgres is parked on
+# the event loop instead of holding a worker thread. They reuse the DRF
+# views' querysets, pagination and serializers, and render the same JSON.
+def json_response(data, status=200):
+    return HttpResponse(
+        renderer.render(data), status=status, content_type="application/json"
+    )
+
+
+# GET served by the async view, anything else by the sync DRF view
+def async_reads(async_view, sync_view):
+    async def view(request, *args, **kwargs):
+        if request.method in ("GET", "HEAD"):
+            return await async_view(request, *args, **kwargs)
+        return await sync_to_async(sync_view)(request, *args, **kwargs)
+
+    return csrf_exempt(view)
+
+
+def get_view(view_class, request):
+    return view_class(request=Request(request), args=(), kwargs={}, format_kwarg=None)
+
+
+async def list_response(view_class, request):
+    view = get_view(view_class, request)
+    try:
+        data = await view.alist()
+    except APIException as e:
+        return json_response({"detail": e.detail}, status=e.status_code)
+    return json_response(data)
+
+
+@require_safe
+@cache.cache_response_async("product")
+async def product_detail(request):
+    slug = request.GET.get("slug")
+    if not slug:
+        return json_response({"message": "Slug is required"}, status=400)
+    product = await sync_to_async(documents.product_detail)(slug)
+    if product is None:
+        return json_response({"message": "Product not found"}, status=404)
+    return json_response(product)
+
+
+@require_safe
+@cache.cache_response_async("product", store=False)
+async def product_list(request):
+    if "export" in request.GET:
+        view = get_view(views.ProductListView, request)
+        try:
+            return view.export(exports.aiter_export)
+        except ValueError as e:
+            return json_response({"message": str(e)}, status=400)
+    return await list_response(views.ProductListView, request)
+
+
+@require_safe
+@cache.cache_response_async("brand")
+async def brand_detail(request):
+    slug = request.GET.get("slug")
+    if not slug:
+        return json_response({"message": "Slug is required"}, status=400)
+    try:
+        brand = await models.Brand.objects.select_related("stats").aget(slug=slug)
+    except models.Brand.DoesNotExist:
+        return json_response({"message": "Brand not found"}, status=404)
+    return json_response(serializers.BrandSerializer(brand).data)
+
+
+@require_safe
+@cache.cache_response_async("brand", vary=views.shuffle_seed)
+async def brand_list(request):
+    return await list_response(views.BrandListView, request)
+
+
+@require_safe
+@cache.cache_response_async("category", vary=views.shuffle_seed)
+async def category_list(request):
+    return await list_response(views.CategoryListView, request)
+
+
+async def list_slugs(request, queryset):
+    try:
+        slugs = views.slugs_since(queryset, request.GET.get("since"))
+    except ValueError as e:
+        return json_response({"message": str(e)}, status=400)
+    return json_response([slug async for slug in slugs])
+
+
+@require_safe
+@cache.cache_response_async("product")
+async def product_slugs(request):
+    return await list_slugs(request, models.Product.objects.all())
+
+
+@require_safe
+@cache.cache_response_async("brand")
+async def brand_slugs(request):
+    return await list_slugs(request, models.Brand.objects.all())
+
+
+@require_safe
+@cache.cache_response_async("category")
+async def category_slugs(request):
+    return await list_slugs(request, models.Category.objects.all())
@@ -1,9 +1,85 @@
 # authentication.py
 
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
 from rest_framework.exceptions import AuthenticationFailed as DRFAuthenticationFailed
 
+from .models import Customer
+
+USERNAME_CLAIM = "username"
+CUSTOMER_CLAIM = "customer_id"
+VERSION_CLAIM = "ver"
+
+
+# Tokens carry the username, customer id and the customer's token version,
+# so validate_user can answer from the token alone. Bumping
+# Customer.token_version revokes every token issued before.
+def get_tokens(user, customer=None):
+    refresh = RefreshToken.for_user(user)
+    refresh[USERNAME_CLAIM] = user.username
+    if customer is not None:
+        refresh[CUSTOMER_CLAIM] = customer.id
+        refresh[VERSION_CLAIM] = customer.token_version
+    return refresh
+
+
+# Principal cache
+#
+# Authenticated (user, customer) pairs by token jti, kept for a few seconds
+# so bursts of requests with the same token skip the database. Entries are
+# per process: invalidate_user drops a user's entries in this process and
+# the short TTL bounds how long other processes can lag behind.
+class PrincipalCache:
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, jti):
+        with self.lock:
+            entry = self.entries.get(jti)
+            if entry is None:
+                return None
+            expires, principal = entry
+            if expires < time.monotonic():
+                del self.entries[jti]
+                return None
+            return principal
+
+    def set(self, jti, principal):
+        if self.ttl <= 0:
+            return
+        with self.lock:
+            self.entries[jti] = (time.monotonic() + self.ttl, principal)
+            self.entries.move_to_end(jti)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        with self.lock:
+            for jti, (_, (user, _)) in list(self.entries.items()):
+                if user.pk == user_id:
+                    del self.entries[jti]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+principals = PrincipalCache(
+    settings.AUTH_PRINCIPAL_CACHE_TTL, settings.AUTH_PRINCIPAL_CACHE_SIZE
+)
+
 
 class CustomJWTAuthentication(JWTAuthentication):
     def authenticate(self, request):
@@ -14,8 +90,69 @@ class CustomJWTAuthentication(JWTAuthentication):
 
         try:
             validated_token = self.get_validated_token(access_token)
-            return self.get_user(validated_token), validated_token
+            user, customer = self.get_principal(validated_token)
+            request.customer = customer
+            return user, validated_token
         except (InvalidToken, AuthenticationFailed) as e:
             raise DRFAuthenticationFailed(str(e))
 
         return None
+
+    # Copies of the cached instances, so views can modify them freely
+    def get_principal(self, validated_token):
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        principal = principals.get(jti) if jti else None
+        if principal is None:
+            principal = self.load_principal(validated_token)
+            if jti:
+                principals.set(jti, principal)
+
+        user, customer = principal
+        user = copy.copy(user)
+        if customer is not None:
+            customer = copy.copy(customer)
+            customer.user = user
+        return user, customer
+
+    # User and customer profile in a single query
+    def load_principal(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        customer = (
+            Customer.objects.select_related("user")
+            .filter(**{f"user__{api_settings.USER_ID_FIELD}": user_id})
+            .order_by("id")
+            .first()
+        )
+        if customer is None:
+            # Users without a profile, e.g. staff
+            return self.get_user(validated_token), None
+
+        # Tokens issued before versioning count as version 1
+        if validated_token.get(VERSION_CLAIM, 1) != customer.token_version:
+            raise AuthenticationFailed("Token has been revoked", code="token_revoked")
+
+        user = customer.user
+        if not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(
+                "The user's password has been changed.", code="password_changed"
+            )
+        return user, customer
+
+
+# The customer profile resolved while authenticating the request, raising
+# Customer.DoesNotExist like Customer.objects.get(user=...) when there is none
+def get_customer(request):
+    user = request.user
+    if not hasattr(request, "customer"):
+        return Customer.objects.get(user=user)
+    if request.customer is None:
+        raise Customer.DoesNotExist("Customer matching query does not exist.")
+    return request.customer
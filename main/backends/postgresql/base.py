@@ -0,0 +1,29 @@
+import time
+
+from django.db.backends.postgresql import base
+
+from main import metrics
+
+
+# PostgreSQL backend with request accounting
+#
+# get_new_connection takes a connection from the pool, or opens one when
+# pooling is off, so its duration is what the request waited for a
+# connection. Checkouts and queries are recorded in main.metrics for the
+# Server-Timing entries of main.middleware.
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.execute_wrappers.append(metrics.record_query)
+
+    def get_new_connection(self, conn_params):
+        start = time.perf_counter()
+        try:
+            return super().get_new_connection(conn_params)
+        finally:
+            metrics.record_checkout(time.perf_counter() - start)
+
+    def pool_stats(self):
+        if self.pool is None:
+            return None
+        return self.pool.get_stats()
@@ -0,0 +1,217 @@
+import hashlib
+import threading
+from functools import wraps
+
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.db.models import F
+from django.db.models.functions import Now
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from . import models
+
+CACHE_ALIAS = "responses"
+CACHEABLE_STATUSES = (200,)
+
+_counters = {"hits": 0, "misses": 0}
+_counters_lock = threading.Lock()
+
+
+# Versions
+#
+# Every cached response key embeds the current version of the namespaces it
+# depends on, and writes bump those versions in the database. A bump makes
+# the old keys unreachable, so invalidation is exact on any cache backend and
+# across processes; stale entries simply age out.
+def get_versions(names):
+    return collect_versions(names, version_rows(names))
+
+
+async def aget_versions(names):
+    return collect_versions(names, [row async for row in version_rows(names)])
+
+
+def version_rows(names):
+    return models.CacheVersion.objects.filter(name__in=names).values_list(
+        "name", "version", "updated_at"
+    )
+
+
+def collect_versions(names, rows):
+    versions = {name: 1 for name in names}
+    last_modified = None
+    for name, version, updated_at in rows:
+        versions[name] = version
+        if last_modified is None or updated_at > last_modified:
+            last_modified = updated_at
+    return versions, last_modified
+
+
+def bump(*names):
+    updated = models.CacheVersion.objects.filter(name__in=names).update(
+        version=F("version") + 1, updated_at=Now()
+    )
+    if updated < len(names):
+        models.CacheVersion.objects.bulk_create(
+            [models.CacheVersion(name=name, version=2) for name in names],
+            ignore_conflicts=True,
+        )
+
+
+# Counters of the lookups made in this process, reported per case by
+# benchmark_endpoints
+def record(hit):
+    with _counters_lock:
+        _counters["hits" if hit else "misses"] += 1
+
+
+def stats():
+    with _counters_lock:
+        return dict(_counters)
+
+
+def reset_stats():
+    with _counters_lock:
+        _counters.update(hits=0, misses=0)
+
+
+# Conditional GET
+def get_etag(path, versions):
+    state = ":".join(f"{name}.{version}" for name, version in versions.items())
+    return 'W/"{}"'.format(hashlib.md5(f"{path}:{state}".encode()).hexdigest())
+
+
+def is_not_modified(request, etag, last_modified):
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match:
+        # Weak comparison; If-Modified-Since is ignored when If-None-Match
+        # is present (RFC 9110 13.2.2)
+        tags = [tag.removeprefix("W/") for tag in parse_etags(if_none_match)]
+        return "*" in tags or etag.removeprefix("W/") in tags
+
+    if_modified_since = parse_http_date_safe(
+        request.META.get("HTTP_IF_MODIFIED_SINCE", "")
+    )
+    if if_modified_since is None or last_modified is None:
+        return False
+    # HTTP dates have whole seconds, like the Last-Modified sent; a write
+    # later in the same second changes the ETag, which clients prefer
+    return int(last_modified.timestamp()) <= if_modified_since
+
+
+def etag_key(etag):
+    return etag.removeprefix("W/").strip('"')
+
+
+def set_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+
+
+# Response cache
+#
+# Wraps a public GET view that depends on the given namespaces. Requests
+# whose validators still match get a 304 before the view runs, and with
+# store=True the response data is cached keyed by its full path and the
+# current namespace versions. vary(request) adds anything else the response
+# depends on to the key.
+def cache_response(*names, store=True, vary=None):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            request = next(arg for arg in args if isinstance(arg, Request))
+            versions, last_modified = get_versions(names)
+            path = request.get_full_path()
+            if vary is not None:
+                path = f"{path}#{vary(request)}"
+            etag = get_etag(path, versions)
+
+            if is_not_modified(request, etag, last_modified):
+                response = Response(status=304)
+                set_validators(response, etag, last_modified)
+                return response
+
+            if not store:
+                response = view(*args, **kwargs)
+                if response.status_code == 200:
+                    set_validators(response, etag, last_modified)
+                return response
+
+            key = f"response:{etag_key(etag)}"
+            cache = caches[CACHE_ALIAS]
+            cached = cache.get(key)
+            record(hit=cached is not None)
+            if cached is not None:
+                status, data = cached
+                response = Response(data, status=status)
+                response["X-Cache"] = "HIT"
+                set_validators(response, etag, last_modified)
+                return response
+
+            response = view(*args, **kwargs)
+            if response.status_code in CACHEABLE_STATUSES:
+                cache.set(key, (response.status_code, response.data))
+                set_validators(response, etag, last_modified)
+            response["X-Cache"] = "MISS"
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+# Async views
+#
+# The same validators and versioned keys for async views returning rendered
+# JSON HttpResponses. The rendered body is cached, under its own prefix as
+# the sync cache holds response data.
+def cache_response_async(*names, store=True, vary=None):
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            versions, last_modified = await aget_versions(names)
+            path = request.get_full_path()
+            if vary is not None:
+                path = f"{path}#{vary(request)}"
+            etag = get_etag(path, versions)
+
+            if is_not_modified(request, etag, last_modified):
+                response = HttpResponseNotModified()
+                set_validators(response, etag, last_modified)
+                return response
+
+            if not store:
+                response = await view(request, *args, **kwargs)
+                if response.status_code == 200:
+                    set_validators(response, etag, last_modified)
+                return response
+
+            key = f"rendered:{etag_key(etag)}"
+            cache = caches[CACHE_ALIAS]
+            cached = await cache.aget(key)
+            record(hit=cached is not None)
+            if cached is not None:
+                status, content_type, content = cached
+                response = HttpResponse(
+                    content, status=status, content_type=content_type
+                )
+                response["X-Cache"] = "HIT"
+                set_validators(response, etag, last_modified)
+                return response
+
+            response = await view(request, *args, **kwargs)
+            if response.status_code in CACHEABLE_STATUSES:
+                await cache.aset(
+                    key,
+                    (response.status_code, response["Content-Type"], response.content),
+                )
+                set_validators(response, etag, last_modified)
+            response["X-Cache"] = "MISS"
+            return response
+
+        return wrapper
+
+    return decorator
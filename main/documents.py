@@ -0,0 +1,140 @@
+from django.db import connection
+from django.db.models import Prefetch
+
+from . import models, serializers
+
+
+def table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+# DRF's rendering of datetimes: UTC ISO 8601 with a Z suffix, microseconds
+# only when there are any
+def datetime_sql(column):
+    return f"""(
+        to_char({column} AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS')
+        || CASE WHEN mod(extract(microseconds FROM {column})::bigint, 1000000) = 0
+            THEN '' ELSE to_char({column} AT TIME ZONE 'UTC', '.US') END
+        || 'Z'
+    )"""
+
+
+# Product detail
+#
+# The whole ProductSerializer document (brand with its stats, category, tags,
+# reviews with their likes and the rating summary) is built by Postgres in a
+# single statement. Decimals are rendered as text and datetimes as DRF does,
+# so the response is byte-for-byte the serializer's; product_detail_serialized
+# is the reference path.
+PRODUCT_DETAIL_SQL = f"""
+    SELECT json_build_object(
+        'id', p.id,
+        'brand', json_build_object(
+            'id', b.id,
+            'vendor', b.vendor_id,
+            'name', b.name,
+            'description', b.description,
+            'slug', b.slug,
+            'image', b.image,
+            'total_products', coalesce(s.product_count, 0),
+            'reviews', json_build_object(
+                'avg_review', CASE WHEN coalesce(s.review_count, 0) = 0 THEN 0.0
+                    ELSE s.rating_sum::float8 / s.review_count END,
+                'total_reviews', coalesce(s.review_count, 0)
+            )
+        ),
+        'category', json_build_object(
+            'id', c.id,
+            'name', c.name,
+            'slug', c.slug,
+            'image', c.image
+        ),
+        'name', p.name,
+        'description', p.description,
+        'content', p.content,
+        'slug', p.slug,
+        'tags', coalesce((
+            SELECT json_agg(json_build_object('id', t.id, 'name', t.name) ORDER BY t.id)
+            FROM {table(models.ProductTag)} t
+            JOIN {table(models.Product.tags.through)} pt ON pt.producttag_id = t.id
+            WHERE pt.product_id = p.id
+        ), '[]'),
+        'price', p.price::text,
+        'discount', p.discount::text,
+        'details', p.details,
+        'reviews', coalesce((
+            SELECT json_agg(json_build_object(
+                'id', r.id,
+                'product', r.product_id,
+                'review_by', r.review_by,
+                'rating', r.rating,
+                'review', r.review,
+                'likes', coalesce((
+                    SELECT json_agg(l.customer_id ORDER BY l.id)
+                    FROM {table(models.ReviewLike)} l
+                    WHERE l.review_id = r.id
+                ), '[]'),
+                'like_count', r.like_count,
+                'created_at', {datetime_sql("r.created_at")}
+            ) ORDER BY r.id)
+            FROM {table(models.Review)} r
+            WHERE r.product_id = p.id
+        ), '[]'),
+        'images', to_json(p.images),
+        'created_at', {datetime_sql("p.created_at")},
+        'rating', json_build_object(
+            'average', p.rating_avg,
+            'count', p.rating_count,
+            'histogram', json_build_object(
+                '1', p.rating_histogram[1],
+                '2', p.rating_histogram[2],
+                '3', p.rating_histogram[3],
+                '4', p.rating_histogram[4],
+                '5', p.rating_histogram[5]
+            )
+        )
+    )
+    FROM {table(models.Product)} p
+    JOIN {table(models.Brand)} b ON b.id = p.brand_id
+    LEFT JOIN {table(models.BrandStats)} s ON s.brand_id = b.id
+    JOIN {table(models.Category)} c ON c.id = p.category_id
+    WHERE p.slug = %s
+"""
+
+
+def product_detail(slug):
+    with connection.cursor() as cursor:
+        cursor.execute(PRODUCT_DETAIL_SQL, [slug])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    document = row[0]
+    # JSON has no float type, whole floats come back as ints
+    document["rating"]["average"] = float(document["rating"]["average"])
+    reviews = document["brand"]["reviews"]
+    reviews["avg_review"] = float(reviews["avg_review"])
+    return document
+
+
+def product_detail_queryset():
+    return (
+        models.Product.objects.select_related("category", "brand__stats")
+        .prefetch_related(
+            Prefetch("tags", queryset=models.ProductTag.objects.order_by("id")),
+            Prefetch(
+                "reviews",
+                queryset=models.Review.objects.order_by("id").prefetch_related(
+                    Prefetch("likes", queryset=models.ReviewLike.objects.order_by("id"))
+                ),
+            ),
+        )
+        .defer("search_vector")
+    )
+
+
+def product_detail_serialized(slug):
+    try:
+        product = product_detail_queryset().get(slug=slug)
+    except models.Product.DoesNotExist:
+        return None
+    return serializers.ProductSerializer(product).data
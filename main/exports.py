@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .imports import LIST_SEPARATOR
+
+# Content type per format
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+# Catalog export
+#
+# Rows are read from a server-side cursor chunk_size at a time, with the
+# prefetches run per chunk, and serialized and rendered a chunk at a time,
+# so memory stays flat whatever the size of the catalog. NDJSON is one
+# serialized product per line. CSV flattens it: lists of plain values are
+# joined with the import's LIST_SEPARATOR and nested objects are JSON, so
+# exported images and details read back with main/imports.py.
+def get_format(value):
+    value = value or "ndjson"
+    if value not in FORMATS:
+        raise ValueError(f"Unsupported export format '{value}', use ndjson or csv")
+    return value
+
+
+def dumps(value):
+    return json.dumps(value, cls=JSONEncoder, ensure_ascii=False)
+
+
+def csv_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, dict):
+        return dumps(value)
+    if isinstance(value, list):
+        if any(isinstance(item, (list, dict)) for item in value):
+            return dumps(value)
+        return LIST_SEPARATOR.join(str(item) for item in value)
+    return value
+
+
+def render_csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def render(data, export_format, columns):
+    if export_format == "ndjson":
+        return "".join(dumps(item) + "\n" for item in data)
+    return render_csv([[csv_cell(item.get(name)) for name in columns] for item in data])
+
+
+# serialize(objects) gives the representations of one chunk, columns the
+# CSV header
+def iter_export(queryset, serialize, columns, export_format, chunk_size=1000):
+    if export_format == "csv":
+        yield render_csv([columns])
+    chunk = []
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            yield render(serialize(chunk), export_format, columns)
+            chunk = []
+    if chunk:
+        yield render(serialize(chunk), export_format, columns)
+
+
+# The same for the async views, which StreamingHttpResponse serves without
+# first reading the whole iterator into a list
+async def aiter_export(queryset, serialize, columns, export_format, chunk_size=1000):
+    if export_format == "csv":
+        yield render_csv([columns])
+    chunk = []
+    async for obj in queryset.aiterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            yield render(serialize(chunk), export_format, columns)
+            chunk = []
+    if chunk:
+        yield render(serialize(chunk), export_format, columns)
@@ -0,0 +1,479 @@
+import csv
+import io
+import json
+import logging
+import mimetypes
+import zipfile
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+from . import cache, models, search, stats, storage
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "jsonl")
+IMAGES_PER_PRODUCT = 4
+# CSV cells holding lists
+LIST_SEPARATOR = "|"
+
+
+# Bulk product import
+#
+# Rows come from CSV or JSONL with the fields of ProductView.post: name,
+# description, content, brand and category (id or slug), price, discount,
+# details (a JSON list), plus tags (names, created when missing) and four
+# images. Images are names handed to an image resolver, which returns a
+# function opening the file, or raises ValueError when the image is missing
+# or too large.
+#
+# Every row is validated before anything is written, with brands,
+# categories, taken slugs and tags resolved by a handful of set-based
+# queries. Valid rows are imported in batches: ids are reserved from the
+# product sequence, the images of the batch are uploaded concurrently
+# under them outside of any transaction, so no transaction or pooled
+# connection waits on the storage, then the complete rows are inserted in
+# one transaction. A row whose uploads fail is left out alone. The report
+# has one entry per row: created, invalid or failed.
+def read_rows(data, file_format):
+    if file_format not in FORMATS:
+        raise ValueError(f"Unsupported format '{file_format}', use csv or jsonl")
+    if isinstance(data, bytes):
+        data = data.decode("utf-8-sig")
+
+    if file_format == "csv":
+        try:
+            for row in csv.DictReader(io.StringIO(data)):
+                yield {key: value for key, value in row.items() if key}, None
+        except csv.Error as e:
+            raise ValueError(f"Invalid CSV: {e}")
+        return
+
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield {}, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield {}, "Each line must be a JSON object"
+            continue
+        yield row, None
+
+
+def split_list(value):
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return [item.strip() for item in str(value).split(LIST_SEPARATOR) if item.strip()]
+
+
+# JSONL cells may hold any JSON value: numbers are read as text, while
+# objects and lists are rejected
+def parse_text(value, name, errors):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        errors.append(f"{name} must be text")
+        return ""
+    return str(value).strip()
+
+
+def parse_decimal(value, name, errors, default=None):
+    if value in (None, ""):
+        if default is None:
+            errors.append(f"{name} is required")
+        return default
+    try:
+        value = Decimal(str(value).strip())
+    except InvalidOperation:
+        value = None
+    if value is None or not value.is_finite():
+        errors.append(f"{name} must be a number")
+        return None
+    # Within the digits and places of the column, so that a bad row cannot
+    # fail the insert of its whole batch
+    field = models.Product._meta.get_field(name)
+    try:
+        field.run_validators(value)
+    except ValidationError:
+        whole = field.max_digits - field.decimal_places
+        errors.append(
+            f"{name} must have at most {whole} digits before the decimal point "
+            f"and {field.decimal_places} after"
+        )
+        return None
+    return value
+
+
+def parse_details(value, errors):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value) if value.strip() else None
+        except ValueError:
+            errors.append("details must be JSON")
+            return None
+    if not value:
+        errors.append("details is required")
+        return None
+    return value
+
+
+# Field checks of ProductView.post for one row
+def parse_row(row, open_image):
+    errors = []
+    name = parse_text(row.get("name"), "name", errors)
+    description = parse_text(row.get("description"), "description", errors)
+    if not name:
+        errors.append("name is required")
+    elif len(name) < 6:
+        errors.append("Product name must be above 5 characters")
+    elif len(name) > 500:
+        errors.append("Product name must not exceed 500 characters")
+    elif not slugify(name):
+        errors.append("Product name must contain letters or digits")
+    if not description:
+        errors.append("description is required")
+    elif len(description) > 1000:
+        errors.append("description must not exceed 1000 characters")
+    brand = parse_text(row.get("brand"), "brand", errors)
+    category = parse_text(row.get("category"), "category", errors)
+    content = parse_text(row.get("content"), "content", errors)
+    if not brand:
+        errors.append("brand is required")
+    if not category:
+        errors.append("category is required")
+
+    price = parse_decimal(row.get("price"), "price", errors)
+    if price is not None and price < 1:
+        errors.append("Price must be above 0")
+    discount = parse_decimal(row.get("discount"), "discount", errors, Decimal(0))
+    if discount is not None and not 0 <= discount <= 100:
+        errors.append("Discount must be between 0 and 100")
+    details = parse_details(row.get("details"), errors)
+    tags = split_list(row.get("tags"))
+    for tag in tags:
+        if len(tag) > 50:
+            errors.append(f"Tag '{tag}' exceeds 50 characters")
+
+    images = split_list(row.get("images"))
+    if len(images) != IMAGES_PER_PRODUCT:
+        errors.append(f"Exactly {IMAGES_PER_PRODUCT} images are required")
+    openers = []
+    for image in images:
+        try:
+            openers.append((image, open_image(image)))
+        except ValueError as e:
+            errors.append(str(e))
+
+    return {
+        "name": name,
+        "slug": slugify(name),
+        "description": description,
+        "content": content or None,
+        "brand": brand,
+        "category": category,
+        "price": price,
+        "discount": discount,
+        "details": details,
+        "tags": tags,
+        "images": openers,
+    }, errors
+
+
+# A reference is a slug, or else an id: an all-digit slug wins over the id,
+# and numbers too long for a bigint can only be slugs
+def resolve(queryset, references):
+    ids = {int(ref) for ref in references if ref.isdecimal() and len(ref) < 19}
+    rows = queryset.filter(Q(id__in=ids) | Q(slug__in=references)).values_list(
+        "id", "slug"
+    )
+    found = {str(id): id for id, _ in rows}
+    found.update({slug: id for id, slug in rows})
+    return found
+
+
+def validate_rows(rows, customer, open_image):
+    parsed = []
+    for number, (row, error) in enumerate(rows, start=1):
+        if error:
+            parsed.append((number, None, [error]))
+            continue
+        product, errors = parse_row(row, open_image)
+        parsed.append((number, product, errors))
+
+    products = [product for _, product, _ in parsed if product]
+    # Vendors import into their own brands only
+    brands = resolve(
+        models.Brand.objects.filter(vendor=customer),
+        {product["brand"] for product in products},
+    )
+    categories = resolve(
+        models.Category.objects.all(), {product["category"] for product in products}
+    )
+    taken = set(
+        models.Product.objects.filter(
+            slug__in={product["slug"] for product in products}
+        ).values_list("slug", flat=True)
+    )
+
+    valid, report, seen = [], [], set()
+    for number, product, errors in parsed:
+        if product is not None:
+            product["brand_id"] = brands.get(product["brand"])
+            product["category_id"] = categories.get(product["category"])
+            if product["brand"] and product["brand_id"] is None:
+                errors.append(f"Brand '{product['brand']}' not found")
+            if product["category"] and product["category_id"] is None:
+                errors.append(f"Category '{product['category']}' not found")
+            if product["slug"] and (
+                product["slug"] in taken or product["slug"] in seen
+            ):
+                errors.append("Product with this name already exists")
+            seen.add(product["slug"])
+        if errors:
+            report.append({"row": number, "status": "invalid", "errors": errors})
+        else:
+            valid.append((number, product))
+            report.append({"row": number, "status": "valid", "slug": product["slug"]})
+    return valid, report
+
+
+def get_tags(names):
+    names = set(names)
+    if not names:
+        return {}
+    models.ProductTag.objects.bulk_create(
+        [models.ProductTag(name=name) for name in names], ignore_conflicts=True
+    )
+    return dict(
+        models.ProductTag.objects.filter(name__in=names).values_list("name", "id")
+    )
+
+
+# Takes ids from the product sequence ahead of the insert, so the images
+# can be stored under their product before the row exists
+def reserve_ids(count):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+            "FROM generate_series(1, %s)",
+            [models.Product._meta.db_table, count],
+        )
+        return [id for id, in cursor.fetchall()]
+
+
+# Removes the images of products that could not be completed
+def remove_images(paths):
+    if not paths:
+        return
+    try:
+        storage.remove_paths(paths)
+    except Exception:
+        logger.exception("Failed to remove the images of failed imports")
+
+
+def import_batch(batch, customer, tags):
+    backend = storage.get_storage()
+    try:
+        ids = reserve_ids(len(batch))
+    except Exception as e:
+        return {
+            number: {"row": number, "status": "failed", "errors": [str(e)]}
+            for number, _ in batch
+        }
+
+    uploads, paths_of = [], {}
+    for id, (_, row) in zip(ids, batch):
+        folder = storage.folder_path("products", id)
+        paths_of[id] = [
+            f"{folder}{index}_{name.rsplit('/', 1)[-1]}"
+            for index, (name, _) in enumerate(row["images"])
+        ]
+        uploads += zip(paths_of[id], [opener for _, opener in row["images"]])
+    errors = storage.upload_batch(uploads)
+    uploaded = [path for path, _ in uploads if path not in errors]
+
+    results, created, failed_paths = {}, [], set()
+    for id, (number, row) in zip(ids, batch):
+        row_errors = [
+            f"Failed to upload image '{name}': {errors[path]}"
+            for path, (name, _) in zip(paths_of[id], row["images"])
+            if path in errors
+        ]
+        if row_errors:
+            failed_paths.update(paths_of[id])
+            results[number] = {"row": number, "status": "failed", "errors": row_errors}
+        else:
+            created.append((id, number, row))
+
+    # All or nothing per row: a row with failed uploads is never inserted,
+    # and the images of it that did make it are removed
+    remove_images([path for path in uploaded if path in failed_paths])
+    if not created:
+        return results
+
+    # The rows are inserted complete, images included, so no product is
+    # ever listed without its images
+    try:
+        with transaction.atomic():
+            models.Product.objects.bulk_create(
+                [
+                    models.Product(
+                        id=id,
+                        vendor=customer,
+                        brand_id=row["brand_id"],
+                        category_id=row["category_id"],
+                        name=row["name"],
+                        description=row["description"],
+                        content=row["content"],
+                        slug=row["slug"],
+                        price=row["price"],
+                        discount=row["discount"],
+                        details=row["details"],
+                        images=[backend.public_url(path) for path in paths_of[id]],
+                    )
+                    for id, _, row in created
+                ]
+            )
+            models.Product.tags.through.objects.bulk_create(
+                [
+                    models.Product.tags.through(product_id=id, producttag_id=tags[name])
+                    for id, _, row in created
+                    for name in dict.fromkeys(row["tags"])
+                ]
+            )
+            search.update_search_vectors(
+                models.Product.objects.filter(id__in=[id for id, _, _ in created])
+            )
+    except Exception as e:
+        remove_images([path for path in uploaded if path not in failed_paths])
+        results.update(
+            {
+                number: {"row": number, "status": "failed", "errors": [str(e)]}
+                for _, number, _ in created
+            }
+        )
+        return results
+
+    for id, number, row in created:
+        results[number] = {
+            "row": number,
+            "status": "created",
+            "id": id,
+            "slug": row["slug"],
+        }
+    return results
+
+
+def import_products(rows, customer, open_image, batch_size=None, dry_run=False):
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+    valid, report = validate_rows(rows, customer, open_image)
+    if dry_run or not valid:
+        return report
+
+    tags = get_tags(name for _, row in valid for name in row["tags"])
+    results = {}
+    for start in range(0, len(valid), batch_size):
+        results.update(import_batch(valid[start : start + batch_size], customer, tags))
+
+    brand_ids = {row["brand_id"] for _, row in valid}
+    with transaction.atomic():
+        stats.rebuild_brand_stats(brand_ids=brand_ids)
+    cache.bump("product", "brand")
+    return [results.get(entry["row"], entry) for entry in report]
+
+
+def summarize(report):
+    counts = {"created": 0, "valid": 0, "invalid": 0, "failed": 0}
+    for entry in report:
+        counts[entry["status"]] += 1
+    return counts
+
+
+# Image resolvers
+def open_local_file(path):
+    def opener():
+        file = File(open(path, "rb"), name=path.name)
+        file.content_type = mimetypes.guess_type(path.name)[0]
+        return file
+
+    return opener
+
+
+def check_size(name, size):
+    max_size = settings.STORAGE_MAX_UPLOAD_SIZE
+    if size > max_size:
+        raise ValueError(f"Image '{name}' exceeds the maximum size of {max_size} bytes")
+
+
+# Images in a directory, e.g. next to the import file
+def directory_images(directory):
+    directory = directory.resolve()
+
+    def open_image(name):
+        path = (directory / name).resolve()
+        if directory not in path.parents or not path.is_file():
+            raise ValueError(f"Image '{name}' not found")
+        check_size(name, path.stat().st_size)
+        return open_local_file(path)
+
+    return open_image
+
+
+# Images uploaded along with the import, by file name
+def uploaded_images(files):
+    by_name = {file.name: file for file in files}
+
+    def open_image(name):
+        uploaded = by_name.get(name)
+        if uploaded is None:
+            raise ValueError(f"Image '{name}' not found")
+        check_size(name, uploaded.size)
+
+        # A fresh file per upload, so rows sharing an image can be uploaded
+        # concurrently
+        def opener():
+            if hasattr(uploaded, "temporary_file_path"):
+                file = File(open(uploaded.temporary_file_path(), "rb"), name=name)
+            else:
+                file = ContentFile(uploaded.file.getvalue(), name=name)
+            file.content_type = uploaded.content_type
+            return file
+
+        return opener
+
+    return open_image
+
+
+# Images in a zip archive uploaded along with the import, by member name
+def archive_images(archive):
+    try:
+        archive = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise ValueError("The images archive is not a zip file")
+    members = {info.filename: info for info in archive.infolist() if not info.is_dir()}
+
+    def open_image(name):
+        info = members.get(name)
+        if info is None:
+            raise ValueError(f"Image '{name}' not found")
+        check_size(name, info.file_size)
+
+        def opener():
+            file = ContentFile(archive.read(info), name=name.rsplit("/", 1)[-1])
+            file.content_type = mimetypes.guess_type(name)[0]
+            return file
+
+        return opener
+
+    return open_image
@@ -0,0 +1,192 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import models, storage
+
+_tasks = {}
+
+
+# Registers a task handler. Handlers receive the payloads of a whole batch of
+# jobs and return one entry per payload: None on success, else the error.
+def task(name):
+    def decorator(handler):
+        _tasks[name] = handler
+        return handler
+
+    return decorator
+
+
+def enqueue(task_name, payload, max_attempts=None, delay=None):
+    return models.Job.objects.create(
+        task=task_name,
+        payload=payload,
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+        run_at=timezone.now() + (delay or timedelta()),
+    )
+
+
+# Queue
+#
+# Workers lock due jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any number
+# of them can poll the table without handing out a job twice, and mark them
+# running before the lock is released. A job still running after
+# JOB_LOCK_TIMEOUT belongs to a worker that died and is queued again, unless
+# its handler keeps the lock fresh with touch(). A worker can be limited to
+# some tasks, or all but some, so long tasks get workers of their own and do
+# not hold up short ones.
+def claim(batch_size, tasks=None, exclude=None):
+    now = timezone.now()
+    due = models.Job.objects.filter(status="queued", run_at__lte=now)
+    if tasks:
+        due = due.filter(task__in=tasks)
+    if exclude:
+        due = due.exclude(task__in=exclude)
+    due = due.select_for_update(skip_locked=True).order_by("run_at", "id")
+    with transaction.atomic():
+        jobs = list(due[:batch_size])
+        models.Job.objects.filter(id__in=[job.id for job in jobs]).update(
+            status="running", locked_at=now, attempts=F("attempts") + 1
+        )
+    for job in jobs:
+        job.status, job.locked_at, job.attempts = "running", now, job.attempts + 1
+    return jobs
+
+
+def requeue_stale():
+    stale = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    return models.Job.objects.filter(status="running", locked_at__lt=stale).update(
+        status="queued", locked_at=None, error="Worker stopped before finishing"
+    )
+
+
+# Refreshes the lock of the running jobs of a task whose payload holds the
+# given values, for handlers that report progress while they work
+async def atouch(task_name, **payload):
+    return await models.Job.objects.filter(
+        task=task_name, status="running", payload__contains=payload
+    ).aupdate(locked_at=timezone.now())
+
+
+def complete(job):
+    job.status = "done"
+    job.locked_at = None
+    job.error = ""
+    job.save(update_fields=["status", "locked_at", "error", "updated_at"])
+
+
+# Retries with exponential backoff; out of attempts, the job is dead-lettered
+# and stays in the table until it is retried by hand
+def fail(job, error):
+    job.locked_at = None
+    job.error = str(error) or repr(error)
+    if job.attempts >= job.max_attempts:
+        job.status = "dead"
+    else:
+        job.status = "queued"
+        delay = settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+        job.run_at = timezone.now() + timedelta(seconds=delay)
+    job.save(update_fields=["status", "locked_at", "error", "run_at", "updated_at"])
+
+
+def process(jobs):
+    by_task = {}
+    for job in jobs:
+        by_task.setdefault(job.task, []).append(job)
+
+    for task_name, batch in by_task.items():
+        handler = _tasks.get(task_name)
+        if handler is None:
+            for job in batch:
+                job.attempts = job.max_attempts
+                fail(job, f"Unknown task '{task_name}'")
+            continue
+        try:
+            errors = handler([job.payload for job in batch])
+        except Exception as e:
+            errors = [e] * len(batch)
+        for job, error in zip(batch, errors):
+            if error is None:
+                complete(job)
+            else:
+                fail(job, error)
+
+
+def work(batch_size=None, tasks=None, exclude=None):
+    requeue_stale()
+    jobs = claim(batch_size or settings.JOB_BATCH_SIZE, tasks, exclude)
+    process(jobs)
+    return jobs
+
+
+def retry_dead(task_name=None):
+    jobs = models.Job.objects.filter(status="dead")
+    if task_name:
+        jobs = jobs.filter(task=task_name)
+    return jobs.update(status="queued", attempts=0, run_at=timezone.now())
+
+
+# Email
+def send_mail(subject, message, from_email, recipient_list):
+    return enqueue(
+        "send_email",
+        {
+            "subject": subject,
+            "message": message,
+            "from_email": from_email,
+            "recipient_list": list(recipient_list),
+        },
+    )
+
+
+# Sends a batch of queued mails over a single SMTP connection
+@task("send_email")
+def send_emails(payloads):
+    errors = []
+    with get_connection(fail_silently=False) as connection:
+        for payload in payloads:
+            try:
+                EmailMessage(
+                    payload["subject"],
+                    payload["message"],
+                    payload["from_email"],
+                    payload["recipient_list"],
+                    connection=connection,
+                ).send()
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+    return errors
+
+
+# Storage cleanup of deleted objects, queued by BrandView.delete. A cleanup
+# job that failed is resumed where it stopped by the retries of its queued job.
+@task("storage_cleanup")
+def run_storage_cleanups(payloads):
+    errors = []
+    for payload in payloads:
+        cleanups = models.StorageCleanupJob.objects.filter(id=payload["job_id"])
+        cleanups.filter(status="failed").update(status="pending", error="")
+        storage.run_cleanup_job(payload["job_id"])
+        cleanup = cleanups.first()
+        failed = cleanup is not None and cleanup.status == "failed"
+        errors.append(cleanup.error if failed else None)
+    return errors
+
+
+# Link analysis runs queued by the run_link_analysis endpoint
+@task("link_analysis")
+def run_link_analyses(payloads):
+    errors = []
+    for payload in payloads:
+        try:
+            call_command("link_analysis", run_id=payload["run_id"])
+            errors.append(None)
+        except Exception as e:
+            errors.append(e)
+    return errors
@@ -0,0 +1,393 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Optional
+
+import httpx
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import jobs
+from .models import (
+    Brand,
+    Category,
+    LinkAnalysisRun,
+    LinkCheck,
+    LinkCheckHistory,
+    Product,
+)
+
+BASE_URL = settings.SITE_URL
+STATIC_PATHS = ["/", "/products", "/signin", "/register", "/contact"]
+
+
+@dataclass
+class Link:
+    url: str
+    kind: str
+    slug: str = ""
+    timeout: Optional[float] = None
+
+
+@dataclass
+class LinkResult:
+    link: Link
+    status: Optional[int]
+    latency: float
+    attempts: int
+    error: str = ""
+
+    @property
+    def ok(self):
+        return self.status == 200
+
+
+# Links of every public page, with slugs streamed from server-side chunks.
+# With since, only links of objects updated after it are yielded.
+async def iter_links(base_url=BASE_URL, static_timeout=60, chunk_size=2000, since=None):
+    changed = Q() if since is None else Q(updated_at__gt=since)
+
+    for path in STATIC_PATHS:
+        yield Link(f"{base_url}{path}", "static", timeout=static_timeout)
+
+    products = Product.objects.filter(changed).values_list("slug", flat=True)
+    async for slug in products.order_by("id").aiterator(chunk_size=chunk_size):
+        yield Link(f"{base_url}/product/{slug}", "product", slug)
+
+    brands = Brand.objects.filter(changed).values_list("slug", flat=True)
+    async for slug in brands.order_by("id").aiterator(chunk_size=chunk_size):
+        yield Link(f"{base_url}/brand/{slug}", "brand", slug)
+        yield Link(f"{base_url}/products/brand/{slug}", "brand_products", slug)
+
+    categories = Category.objects.filter(changed).values_list("slug", flat=True)
+    async for slug in categories.order_by("id").aiterator(chunk_size=chunk_size):
+        yield Link(f"{base_url}/products/category/{slug}", "category_products", slug)
+
+
+# Links of changed objects, then the size least recently checked of the rest,
+# so every stored URL is re-checked over successive runs
+async def iter_incremental_links(
+    since, sample, base_url=BASE_URL, static_timeout=60, chunk_size=2000
+):
+    seen = set()
+    async for link in iter_links(base_url, static_timeout, chunk_size, since=since):
+        seen.add(link.url)
+        yield link
+
+    if sample <= 0:
+        return
+    stored = (
+        LinkCheck.objects.exclude(kind="static")
+        .values("url", "kind", "slug")
+        .order_by("last_checked", "id")
+    )
+    async for row in stored.aiterator(chunk_size=chunk_size):
+        if row["url"] in seen:
+            continue
+        yield Link(row["url"], row["kind"], row["slug"])
+        sample -= 1
+        if sample == 0:
+            return
+
+
+# Concurrent HEAD checker
+#
+# A fixed pool of workers pulls links from a bounded queue, so memory stays
+# flat however many slugs there are. All workers share one pooled client
+# that keeps connections to the host alive. Network errors, 429 and 5xx are
+# retried with exponential backoff.
+class LinkChecker:
+    def __init__(
+        self, concurrency=20, timeout=10, retries=2, backoff=0.5, on_result=None
+    ):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.on_result = on_result
+
+    def make_client(self):
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency,
+            ),
+            timeout=self.timeout,
+            follow_redirects=False,
+        )
+
+    def should_retry(self, status):
+        return status == 429 or status >= 500
+
+    async def check(self, client, link):
+        timeout = link.timeout or self.timeout
+        for attempt in range(1, self.retries + 2):
+            start = time.perf_counter()
+            try:
+                response = await client.head(link.url, timeout=timeout)
+                latency = time.perf_counter() - start
+                if (
+                    not self.should_retry(response.status_code)
+                    or attempt > self.retries
+                ):
+                    return LinkResult(link, response.status_code, latency, attempt)
+            except httpx.HTTPError as e:
+                latency = time.perf_counter() - start
+                if attempt > self.retries:
+                    return LinkResult(link, None, latency, attempt, str(e) or repr(e))
+            await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+
+    async def run(self, links):
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        results = []
+
+        async with self.make_client() as client:
+
+            async def worker():
+                while True:
+                    link = await queue.get()
+                    try:
+                        if link is None:
+                            return
+                        start = time.perf_counter()
+                        try:
+                            result = await self.check(client, link)
+                        except Exception as e:
+                            # e.g. a malformed stored URL: one bad link must
+                            # not stop a worker and stall the queue
+                            latency = time.perf_counter() - start
+                            result = LinkResult(link, None, latency, 1, repr(e))
+                        results.append(result)
+                        if self.on_result:
+                            self.on_result(result)
+                    finally:
+                        queue.task_done()
+
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            try:
+                async for link in links:
+                    await queue.put(link)
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                for task in workers:
+                    task.cancel()
+
+        return results
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(results):
+    latencies = [result.latency for result in results]
+    broken = [result for result in results if not result.ok]
+    return {
+        "total": len(results),
+        "ok": len(results) - len(broken),
+        "broken": broken,
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_max": max(latencies, default=0.0),
+    }
+
+
+# Results
+#
+# The latest result of every URL is upserted into LinkCheck. last_changed
+# only moves, and a LinkCheckHistory row is only written, when the status
+# of a URL differs from its previous check.
+def record_results(results, run, batch_size=1000):
+    now = timezone.now()
+    for start in range(0, len(results), batch_size):
+        batch = results[start : start + batch_size]
+        previous = {
+            url: (status, last_changed)
+            for url, status, last_changed in LinkCheck.objects.filter(
+                url__in=[result.link.url for result in batch]
+            ).values_list("url", "status", "last_changed")
+        }
+
+        checks, changed = [], []
+        for result in batch:
+            url = result.link.url
+            last_changed = now
+            if url in previous and previous[url][0] == result.status:
+                last_changed = previous[url][1]
+            else:
+                changed.append(result)
+            checks.append(
+                LinkCheck(
+                    url=url,
+                    kind=result.link.kind,
+                    slug=result.link.slug,
+                    status=result.status,
+                    latency=result.latency,
+                    error=result.error,
+                    last_checked=now,
+                    last_changed=last_changed,
+                )
+            )
+        LinkCheck.objects.bulk_create(
+            checks,
+            update_conflicts=True,
+            unique_fields=["url"],
+            update_fields=[
+                "kind",
+                "slug",
+                "status",
+                "latency",
+                "error",
+                "last_checked",
+                "last_changed",
+            ],
+        )
+
+        if changed:
+            ids = dict(
+                LinkCheck.objects.filter(
+                    url__in=[result.link.url for result in changed]
+                ).values_list("url", "id")
+            )
+            LinkCheckHistory.objects.bulk_create(
+                LinkCheckHistory(
+                    link_id=ids[result.link.url],
+                    run=run,
+                    status=result.status,
+                    error=result.error,
+                    changed_at=now,
+                )
+                for result in changed
+            )
+
+
+# Drops stored URLs that no longer exist. A full run checked every URL, so
+# anything it did not touch is gone; an incremental run only knows about
+# slugs that were deleted or renamed.
+def prune_links(run):
+    if not run.incremental:
+        stale = LinkCheck.objects.filter(last_checked__lt=run.started_at)
+    else:
+        stale = LinkCheck.objects.none()
+        for kind, model in (
+            ("product", Product),
+            ("brand", Brand),
+            ("brand_products", Brand),
+            ("category_products", Category),
+        ):
+            stale |= LinkCheck.objects.filter(kind=kind).exclude(
+                slug__in=model.objects.values("slug")
+            )
+    return stale.delete()[1].get(LinkCheck._meta.label, 0)
+
+
+def last_run():
+    return LinkAnalysisRun.objects.filter(status="done").order_by("-started_at").first()
+
+
+def broken_links():
+    return LinkCheck.objects.exclude(status=200).order_by("-last_changed", "id")
+
+
+def count_links(since=None, sample=0):
+    changed = Q() if since is None else Q(updated_at__gt=since)
+    total = (
+        len(STATIC_PATHS)
+        + Product.objects.filter(changed).count()
+        + 2 * Brand.objects.filter(changed).count()
+        + Category.objects.filter(changed).count()
+    )
+    if since is not None:
+        total += min(sample, LinkCheck.objects.exclude(kind="static").count())
+    return total
+
+
+# Runs
+#
+# A partial unique constraint allows a single pending or running run, which
+# is what keeps runs from overlapping. Running runs save their progress every
+# PROGRESS_INTERVAL seconds; one that has not reported for STALE_RUN_AFTER is
+# considered dead and failed so a new run can start.
+PROGRESS_INTERVAL = 5
+STALE_RUN_AFTER = timedelta(minutes=10)
+
+
+def active_run():
+    return LinkAnalysisRun.objects.filter(
+        status__in=LinkAnalysisRun.ACTIVE_STATUSES
+    ).first()
+
+
+def fail_stale_runs():
+    stale = timezone.now() - STALE_RUN_AFTER
+    return LinkAnalysisRun.objects.filter(
+        status__in=LinkAnalysisRun.ACTIVE_STATUSES, updated_at__lt=stale
+    ).update(
+        status="failed",
+        error="Stopped reporting progress",
+        finished_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+
+
+# Returns (run, created); when another run is active it is returned instead
+def create_run(incremental=False, status="pending"):
+    fail_stale_runs()
+    try:
+        with transaction.atomic():
+            run = LinkAnalysisRun.objects.create(incremental=incremental, status=status)
+        return run, True
+    except IntegrityError:
+        return active_run(), False
+
+
+def claim_run(run_id):
+    now = timezone.now()
+    return bool(
+        LinkAnalysisRun.objects.filter(id=run_id, status="pending").update(
+            status="running", started_at=now, updated_at=now
+        )
+    )
+
+
+# Checks links while saving the run's counters every PROGRESS_INTERVAL
+async def check_links(checker, links, run, interval=PROGRESS_INTERVAL):
+    on_result = checker.on_result
+
+    def track(result):
+        run.checked += 1
+        if not result.ok:
+            run.broken += 1
+        if on_result:
+            on_result(result)
+
+    async def save_progress():
+        while True:
+            await asyncio.sleep(interval)
+            await run.asave(update_fields=["checked", "broken", "updated_at"])
+            # A run queued by the endpoint keeps its job from being requeued
+            await jobs.atouch("link_analysis", run_id=run.id)
+
+    checker.on_result = track
+    progress = asyncio.create_task(save_progress())
+    try:
+        return await checker.run(links)
+    finally:
+        progress.cancel()
+        checker.on_result = on_result
+
+
+def eta(run):
+    if run.status != "running" or not run.checked or run.total <= run.checked:
+        return None
+    elapsed = (timezone.now() - run.started_at).total_seconds()
+    return round(elapsed / run.checked * (run.total - run.checked), 1)
@@ -0,0 +1,321 @@
+import json
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from main import cache, metrics, models, urls
+from main.authentication import get_tokens
+from main.links import percentile
+
+# Endpoints that create or change data and are left out
+WRITES = {"register", "review-like", "product-import", "rarecraft-link-analysis"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks every endpoint of main/urls.py through the test client: "
+        "latency percentiles, query count and peak memory per endpoint, "
+        "optionally compared with a stored baseline. Run it on a catalog made "
+        "by generate_catalog so the numbers are comparable between runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument(
+            "--password",
+            default="password123",
+            help="Password of the benchmark user, as given to generate_catalog.",
+        )
+        parser.add_argument("--only", action="append", help="Case to run, repeatable.")
+        parser.add_argument(
+            "--cached",
+            action="store_true",
+            help="Let the response cache serve repeated requests.",
+        )
+        parser.add_argument("--baseline", help="Baseline JSON file to compare with.")
+        parser.add_argument(
+            "--save-baseline", help="Write the results to this JSON file."
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.25,
+            help="Allowed relative growth of p50 latency and memory over the baseline.",
+        )
+        parser.add_argument(
+            "--min-delta",
+            type=float,
+            default=2.0,
+            help="Latency growth in ms below which nothing counts as a regression.",
+        )
+        parser.add_argument(
+            "--min-memory-delta",
+            type=float,
+            default=64,
+            help="Memory growth in KiB below which nothing counts as a regression.",
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["iterations"] < 1:
+            raise CommandError("--iterations must be positive.")
+        baseline = None
+        if kwargs["baseline"]:
+            try:
+                baseline = json.loads(Path(kwargs["baseline"]).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read baseline: {e}")
+
+        cases = self.get_cases(kwargs["password"])
+        if kwargs["only"]:
+            unknown = set(kwargs["only"]) - {case[0] for case in cases}
+            if unknown:
+                raise CommandError(f"Unknown cases: {', '.join(sorted(unknown))}")
+            cases = [case for case in cases if case[0] in kwargs["only"]]
+
+        setup_test_environment()
+        try:
+            # The benchmark collects the metrics itself
+            with override_settings(METRICS_SAMPLE_RATE=0):
+                results = {
+                    name: self.run_case(method, path, data, cookie, kwargs)
+                    for name, method, path, data, cookie in cases
+                }
+        finally:
+            teardown_test_environment()
+
+        self.stdout.write(
+            f"{'case':<24} {'status':>6} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'p99 ms':>8} {'queries':>7} {'peak KiB':>9} {'cache hits':>10}"
+        )
+        for name, result in results.items():
+            lookups = result["cache_hits"] + result["cache_misses"]
+            hits = f"{result['cache_hits']}/{lookups}" if lookups else "-"
+            self.stdout.write(
+                f"{name:<24} {result['status']:>6} {result['p50']:>8.2f} "
+                f"{result['p95']:>8.2f} {result['p99']:>8.2f} "
+                f"{result['queries']:>7} {result['peak_memory'] / 1024:>9.1f} "
+                f"{hits:>10}"
+            )
+
+        if kwargs["save_baseline"]:
+            Path(kwargs["save_baseline"]).write_text(
+                json.dumps(results, indent=2, sort_keys=True) + "\n"
+            )
+            self.stdout.write(f"Baseline written to {kwargs['save_baseline']}")
+
+        if baseline is not None:
+            regressions = self.compare(results, baseline, kwargs)
+            if regressions:
+                raise CommandError(
+                    f"{len(regressions)} regressions against the baseline:\n"
+                    + "\n".join(f"  {regression}" for regression in regressions)
+                )
+            self.stdout.write(
+                self.style.SUCCESS("No regressions against the baseline.")
+            )
+
+    # (name, method, path, data, access token) per case, built from the
+    # first rows of the catalog
+    def get_cases(self, password):
+        product = models.Product.objects.order_by("id").first()
+        brand = models.Brand.objects.order_by("id").first()
+        category = models.Category.objects.order_by("id").first()
+        customer = (
+            models.Customer.objects.filter(products__isnull=False)
+            .select_related("user")
+            .order_by("id")
+            .first()
+        )
+        if None in (product, brand, category, customer):
+            raise CommandError("The catalog is empty, run generate_catalog first.")
+        reviewed = models.Product.objects.order_by("-rating_count", "id").first()
+        token = str(get_tokens(customer.user, customer).access_token)
+        staff = User.objects.filter(is_staff=True).order_by("id").first()
+        cleanup_job = models.StorageCleanupJob.objects.order_by("id").first()
+        link_run = models.LinkAnalysisRun.objects.order_by("id").first()
+
+        cases = {
+            "login": [
+                (
+                    "login",
+                    "post",
+                    {"email": customer.user.email, "password": password},
+                    None,
+                )
+            ],
+            "logout": [("logout", "get", {}, token)],
+            "validate_user": [("validate-user", "get", {}, token)],
+            "product-detail": [("product", "get", {"slug": product.slug}, None)],
+            "product-list": [
+                # unpaginated, as legacy clients fetch it
+                ("products-all", "get", {}, None),
+                ("products", "get", {"page_size": 24}, None),
+                ("products-export", "get", {"export": "ndjson"}, None),
+                ("products-export-csv", "get", {"export": "csv"}, None),
+                ("products-latest", "get", {"sortby": "latest", "page_size": 24}, None),
+                (
+                    "products-search",
+                    "get",
+                    {"search": product.name.split()[0], "page_size": 24},
+                    None,
+                ),
+                (
+                    "products-category",
+                    "get",
+                    {"category": category.slug, "page_size": 24},
+                    None,
+                ),
+                (
+                    "products-expanded",
+                    "get",
+                    {"expand": "brand,tags,reviews", "page_size": 24},
+                    None,
+                ),
+            ],
+            "brand-detail": [("brand", "get", {"slug": brand.slug}, None)],
+            "brand-list": [("brands", "get", {}, None)],
+            "category-list": [("categories", "get", {}, None)],
+            "review-detail": [
+                (
+                    "reviews",
+                    "get",
+                    {"product_id": reviewed.id, "sortby": "helpful"},
+                    None,
+                )
+            ],
+            "profile": [("profile", "get", {}, token)],
+            "myproducts": [("myproducts", "get", {}, token)],
+            "mybrands": [("mybrands", "get", {}, token)],
+            "storage-cleanup-status": [
+                (
+                    "storage-cleanup",
+                    "get",
+                    {"id": cleanup_job.id if cleanup_job else 0},
+                    token,
+                )
+            ],
+            "brands-slug-list": [("brand-slugs", "get", {}, None)],
+            "products-slug-list": [("product-slugs", "get", {}, None)],
+            "categories-slug-list": [("category-slugs", "get", {}, None)],
+            "sitemap-index": [("sitemap-index", "get", {}, None)],
+            "sitemap-section": [("sitemap-products", "get", {}, None)],
+            "link-analysis-status": [
+                (
+                    "link-analysis-status",
+                    "get",
+                    {"id": link_run.id if link_run else 0},
+                    None,
+                )
+            ],
+            "broken-links": [
+                (
+                    "broken-links",
+                    "get",
+                    {},
+                    str(get_tokens(staff).access_token) if staff else None,
+                )
+            ],
+            "api-root": [("api-root", "get", {}, token)],
+        }
+        url_kwargs = {"sitemap-section": {"section": "products", "page": 1}}
+
+        result = []
+        # dict.fromkeys: the format suffix patterns repeat a name
+        for url_name in dict.fromkeys(pattern.name for pattern in urls.urlpatterns):
+            if url_name in WRITES:
+                continue
+            if url_name not in cases:
+                self.stderr.write(f"No benchmark case for '{url_name}'")
+                continue
+            path = reverse(url_name, kwargs=url_kwargs.get(url_name))
+            for name, method, data, cookie in cases[url_name]:
+                result.append((name, method, path, data, cookie))
+        return result
+
+    def request(self, client, method, path, data, cookie, bust):
+        if cookie is not None:
+            client.cookies["access_token"] = cookie
+        if bust and method == "get":
+            # A unique query string never hits the response cache
+            data = {**data, "_": time.monotonic_ns()}
+        response = getattr(client, method)(path, data)
+        # Streamed bodies are produced while they are read
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+            response.close()
+        return response
+
+    def run_case(self, method, path, data, cookie, kwargs):
+        client = Client()
+        bust = not kwargs["cached"]
+        # Response cache lookups of this case only
+        cache.reset_stats()
+        status = self.request(client, method, path, data, cookie, bust).status_code
+
+        latencies = []
+        for _ in range(kwargs["iterations"]):
+            start = time.perf_counter()
+            self.request(client, method, path, data, cookie, bust)
+            latencies.append(time.perf_counter() - start)
+
+        with metrics.collect() as collected:
+            self.request(client, method, path, data, cookie, bust)
+
+        tracemalloc.start()
+        try:
+            self.request(client, method, path, data, cookie, bust)
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        counters = cache.stats()
+        return {
+            "status": status,
+            "p50": percentile(latencies, 0.5) * 1000,
+            "p95": percentile(latencies, 0.95) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "queries": collected.queries,
+            "peak_memory": peak_memory,
+            "cache_hits": counters["hits"],
+            "cache_misses": counters["misses"],
+        }
+
+    def compare(self, results, baseline, kwargs):
+        tolerance = 1 + kwargs["tolerance"]
+        regressions = []
+        for name, result in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            if result["status"] != previous["status"]:
+                regressions.append(
+                    f"{name}: status {previous['status']} -> {result['status']}"
+                )
+            if result["queries"] > previous["queries"]:
+                regressions.append(
+                    f"{name}: queries {previous['queries']} -> {result['queries']}"
+                )
+            # The tails of a few iterations are noise, only the median is held
+            if (
+                result["p50"] > previous["p50"] * tolerance
+                and result["p50"] - previous["p50"] > kwargs["min_delta"]
+            ):
+                regressions.append(
+                    f"{name}: p50 {previous['p50']:.2f} ms -> {result['p50']:.2f} ms"
+                )
+            if (
+                result["peak_memory"] > previous["peak_memory"] * tolerance
+                and result["peak_memory"] - previous["peak_memory"]
+                > kwargs["min_memory_delta"] * 1024
+            ):
+                regressions.append(
+                    f"{name}: peak memory {previous['peak_memory'] / 1024:.1f} KiB "
+                    f"-> {result['peak_memory'] / 1024:.1f} KiB"
+                )
+        return regressions
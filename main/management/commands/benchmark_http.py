@@ -0,0 +1,91 @@
+import asyncio
+import itertools
+import time
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+from main.links import percentile
+
+DEFAULT_PATHS = [
+    "/api/products",
+    "/api/products?sortby=latest&page_size=24",
+    "/api/categories",
+    "/api/brands",
+    "/api/product/slugs",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load tests a running server with concurrent requests, e.g. to compare "
+        "'gunicorn rarecraft_backend.wsgi -w 4' with "
+        "'uvicorn rarecraft_backend.asgi:application --workers 4'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument(
+            "--path",
+            action="append",
+            help="Path to request, repeatable. Defaults to the hot public reads.",
+        )
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--timeout", type=float, default=30)
+        parser.add_argument(
+            "--bust-cache",
+            action="store_true",
+            help="Make every URL unique so the response cache never hits.",
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["concurrency"] < 1 or kwargs["requests"] < 1:
+            raise CommandError("--concurrency and --requests must be positive.")
+        paths = kwargs["path"] or DEFAULT_PATHS
+        latencies, statuses, elapsed = asyncio.run(self.run(paths, kwargs))
+
+        errors = sum(1 for status in statuses if status is None or status >= 500)
+        self.stdout.write(
+            f"{len(statuses)} requests, concurrency {kwargs['concurrency']}: "
+            f"{len(statuses) / elapsed:.1f} req/s, {errors} errors"
+        )
+        self.stdout.write(
+            f"Latency p50 {percentile(latencies, 0.5) * 1000:.1f} ms, "
+            f"p95 {percentile(latencies, 0.95) * 1000:.1f} ms, "
+            f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms, "
+            f"max {max(latencies) * 1000:.1f} ms"
+        )
+
+    async def run(self, paths, kwargs):
+        base_url = kwargs["base_url"].rstrip("/")
+        counter = itertools.count()
+        urls = itertools.cycle(paths)
+        latencies, statuses = [], []
+
+        async def worker(client):
+            while next(counter) < kwargs["requests"]:
+                url = base_url + next(urls)
+                if kwargs["bust_cache"]:
+                    separator = "&" if "?" in url else "?"
+                    url = f"{url}{separator}_={time.monotonic_ns()}"
+                start = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    statuses.append(response.status_code)
+                except httpx.HTTPError:
+                    statuses.append(None)
+                latencies.append(time.perf_counter() - start)
+
+        limits = httpx.Limits(
+            max_connections=kwargs["concurrency"],
+            max_keepalive_connections=kwargs["concurrency"],
+        )
+        async with httpx.AsyncClient(
+            limits=limits, timeout=kwargs["timeout"]
+        ) as client:
+            start = time.perf_counter()
+            await asyncio.gather(
+                *(worker(client) for _ in range(kwargs["concurrency"]))
+            )
+            elapsed = time.perf_counter() - start
+        return latencies, statuses, elapsed
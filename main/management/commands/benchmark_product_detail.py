@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from main import documents
+from main.models import Product
+from rest_framework.renderers import JSONRenderer
+
+
+class Command(BaseCommand):
+    help = "Compares the single-query product detail with the serializer path."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--slug",
+            action="append",
+            help="Product to load, repeatable. Defaults to the first --products.",
+        )
+        parser.add_argument("--products", type=int, default=20)
+        parser.add_argument("--iterations", type=int, default=10)
+
+    def handle(self, *args, **kwargs):
+        slugs = kwargs["slug"] or list(
+            Product.objects.order_by("id").values_list("slug", flat=True)[
+                : kwargs["products"]
+            ]
+        )
+        if not slugs:
+            raise CommandError("No products to benchmark.")
+
+        renderer = JSONRenderer()
+        for slug in slugs:
+            document = documents.product_detail(slug)
+            if document is None:
+                raise CommandError(f"Product '{slug}' not found.")
+            fast = renderer.render(document)
+            reference = renderer.render(documents.product_detail_serialized(slug))
+            if fast != reference:
+                raise CommandError(f"Product detail of '{slug}' differs.")
+        self.stdout.write(f"Output identical for {len(slugs)} products")
+
+        for name, load in (
+            ("serializer", documents.product_detail_serialized),
+            ("json_build_object", documents.product_detail),
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                for _ in range(kwargs["iterations"]):
+                    for slug in slugs:
+                        renderer.render(load(slug))
+                elapsed = time.perf_counter() - start
+            requests = kwargs["iterations"] * len(slugs)
+            self.stdout.write(
+                f"{name:>18}: {elapsed / requests * 1000:.2f} ms, "
+                f"{len(queries) / requests:.1f} queries per product"
+            )
@@ -0,0 +1,246 @@
+import random
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from main import cache, models, search, stats
+
+PREFIX = "synthetic"
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+# Skewed towards good ratings, like real reviews
+RATING_WEIGHTS = [5, 5, 15, 35, 40]
+WORDS = (
+    "oak walnut linen wool clay glass brass copper leather cotton ceramic "
+    "stoneware bamboo rattan jute marble hand carved woven glazed forged "
+    "turned dyed stitched blown knotted bowl vase lamp rug basket mug plate "
+    "stool chair tray candle jug scarf bag mirror clock shelf"
+).split()
+
+
+def words(rng, count):
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a deterministic synthetic catalog with bulk_create: the same "
+        "options and --seed always give the same rows. Synthetic rows are "
+        f"prefixed '{PREFIX}' and replaced with --flush."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customers", type=int, default=50)
+        parser.add_argument("--brands", type=int, default=20)
+        parser.add_argument("--categories", type=int, default=10)
+        parser.add_argument("--tags", type=int, default=30)
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument(
+            "--reviews", type=int, default=5, help="Maximum reviews per product."
+        )
+        parser.add_argument(
+            "--likes", type=int, default=3, help="Maximum likes per review."
+        )
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--password",
+            default="password123",
+            help="Password of every synthetic user.",
+        )
+        parser.add_argument(
+            "--flush",
+            action="store_true",
+            help="Delete the synthetic rows of a previous run first.",
+        )
+
+    def handle(self, *args, **kwargs):
+        for name in ("customers", "brands", "categories"):
+            if kwargs[name] < 1:
+                raise CommandError(f"--{name} must be at least 1.")
+        if kwargs["likes"] > kwargs["customers"]:
+            raise CommandError("--likes cannot exceed --customers.")
+
+        with transaction.atomic():
+            if kwargs["flush"]:
+                self.flush()
+            elif User.objects.filter(username__startswith=f"{PREFIX}-").exists():
+                raise CommandError(
+                    "A synthetic catalog already exists, use --flush to replace it."
+                )
+            totals = self.generate(random.Random(kwargs["seed"]), kwargs)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Generated "
+                + ", ".join(f"{total} {name}" for name, total in totals.items())
+                + "."
+            )
+        )
+
+    def flush(self):
+        # Customers cascade to their brands, products, reviews and likes
+        User.objects.filter(username__startswith=f"{PREFIX}-").delete()
+        models.Category.objects.filter(slug__startswith=f"{PREFIX}-").delete()
+        models.ProductTag.objects.filter(name__startswith=f"{PREFIX}-").delete()
+
+    def generate(self, rng, kwargs):
+        batch_size = kwargs["batch_size"]
+        password = make_password(kwargs["password"])
+
+        users = User.objects.bulk_create(
+            [
+                User(
+                    username=f"{PREFIX}-user-{i}",
+                    email=f"{PREFIX}-user-{i}@example.com",
+                    password=password,
+                    date_joined=EPOCH,
+                )
+                for i in range(kwargs["customers"])
+            ],
+            batch_size=batch_size,
+        )
+        customers = models.Customer.objects.bulk_create(
+            [
+                models.Customer(
+                    user=user, image=f"https://picsum.photos/seed/{user}/200"
+                )
+                for user in users
+            ],
+            batch_size=batch_size,
+        )
+        usernames = {
+            customer.id: user.username for customer, user in zip(customers, users)
+        }
+
+        categories = models.Category.objects.bulk_create(
+            [
+                models.Category(
+                    name=f"{PREFIX.title()} Category {i}",
+                    slug=f"{PREFIX}-category-{i}",
+                    image=f"https://picsum.photos/seed/{PREFIX}-category-{i}/400",
+                )
+                for i in range(kwargs["categories"])
+            ]
+        )
+        tags = models.ProductTag.objects.bulk_create(
+            [models.ProductTag(name=f"{PREFIX}-tag-{i}") for i in range(kwargs["tags"])]
+        )
+        brands = models.Brand.objects.bulk_create(
+            [
+                models.Brand(
+                    vendor=rng.choice(customers),
+                    name=f"{PREFIX.title()} Brand {i}",
+                    slug=f"{PREFIX}-brand-{i}",
+                    description=words(rng, 20),
+                    image=f"https://picsum.photos/seed/{PREFIX}-brand-{i}/400",
+                )
+                for i in range(kwargs["brands"])
+            ]
+        )
+
+        totals = {"reviews": 0, "likes": 0}
+        for start in range(0, kwargs["products"], batch_size):
+            end = min(start + batch_size, kwargs["products"])
+            batch = self.generate_products(
+                rng, kwargs, range(start, end), brands, categories
+            )
+            products = models.Product.objects.bulk_create(
+                [product for product, _ in batch]
+            )
+            self.generate_tags(rng, products, tags)
+            counts = self.generate_reviews(
+                rng, kwargs, batch, customers, usernames, batch_size
+            )
+            for name, total in counts.items():
+                totals[name] += total
+
+        stats.rebuild_brand_stats(brand_ids=[brand.id for brand in brands])
+        search.update_search_vectors(models.Product.objects.filter(brand__in=brands))
+        cache.bump("product", "brand", "category")
+
+        return {
+            "customers": len(customers),
+            "brands": len(brands),
+            "categories": len(categories),
+            "tags": len(tags),
+            "products": kwargs["products"],
+            **totals,
+        }
+
+    # Products with their ratings drawn up front, so the rating summary is
+    # set by the same insert
+    def generate_products(self, rng, kwargs, indexes, brands, categories):
+        batch = []
+        for i in indexes:
+            brand = rng.choice(brands)
+            ratings = rng.choices(
+                range(1, 6), RATING_WEIGHTS, k=rng.randint(0, kwargs["reviews"])
+            )
+            product = models.Product(
+                vendor_id=brand.vendor_id,
+                brand=brand,
+                category=rng.choice(categories),
+                name=f"{words(rng, 3).title()} {i}",
+                description=words(rng, 25),
+                content=words(rng, 80),
+                slug=f"{PREFIX}-product-{i}",
+                price=Decimal(rng.randint(500, 50000)) / 100,
+                discount=Decimal(rng.choice([0, 0, 0, 5, 10, 15, 25])),
+                details=[
+                    {"title": "Material", "value": rng.choice(WORDS)},
+                    {"title": "Finish", "value": rng.choice(WORDS)},
+                ],
+                images=[
+                    f"https://picsum.photos/seed/{PREFIX}-product-{i}-{n}/800"
+                    for n in range(4)
+                ],
+                created_at=EPOCH + timedelta(minutes=rng.randint(0, 525600)),
+                rating_count=len(ratings),
+                rating_avg=sum(ratings) / len(ratings) if ratings else 0,
+                rating_histogram=[ratings.count(star) for star in range(1, 6)],
+            )
+            batch.append((product, ratings))
+        return batch
+
+    def generate_tags(self, rng, products, tags):
+        if not tags:
+            return
+        models.Product.tags.through.objects.bulk_create(
+            [
+                models.Product.tags.through(product_id=product.id, producttag_id=tag.id)
+                for product in products
+                for tag in rng.sample(tags, rng.randint(0, min(3, len(tags))))
+            ]
+        )
+
+    def generate_reviews(self, rng, kwargs, batch, customers, usernames, batch_size):
+        reviews, liked_by = [], []
+        for product, ratings in batch:
+            for rating in ratings:
+                likers = rng.sample(customers, rng.randint(0, kwargs["likes"]))
+                reviews.append(
+                    models.Review(
+                        product=product,
+                        review_by=usernames[rng.choice(customers).id],
+                        rating=rating,
+                        review=words(rng, 30),
+                        like_count=len(likers),
+                        created_at=product.created_at
+                        + timedelta(minutes=rng.randint(1, 100000)),
+                    )
+                )
+                liked_by.append(likers)
+        models.Review.objects.bulk_create(reviews, batch_size=batch_size)
+
+        likes = [
+            models.ReviewLike(
+                review=review, customer=customer, created_at=review.created_at
+            )
+            for review, likers in zip(reviews, liked_by)
+            for customer in likers
+        ]
+        models.ReviewLike.objects.bulk_create(likes, batch_size=batch_size)
+        return {"reviews": len(reviews), "likes": len(likes)}
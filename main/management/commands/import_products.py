@@ -0,0 +1,74 @@
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from main import imports
+from main.models import Customer
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports products from a CSV or JSONL file for a vendor. Images are "
+        "file names relative to --images, which defaults to the directory of "
+        "the file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--vendor", required=True, help="Username of the vendor.")
+        parser.add_argument(
+            "--format", choices=imports.FORMATS, help="Defaults to the extension."
+        )
+        parser.add_argument("--images", help="Directory holding the images.")
+        parser.add_argument("--batch-size", type=int)
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Only validate the rows."
+        )
+        parser.add_argument("--report", help="Write the per-row report as JSON.")
+
+    def handle(self, *args, **kwargs):
+        customer = (
+            Customer.objects.filter(user__username=kwargs["vendor"])
+            .order_by("id")
+            .first()
+        )
+        if customer is None:
+            raise CommandError(f"Vendor '{kwargs['vendor']}' not found.")
+        path = Path(kwargs["path"])
+        try:
+            data = path.read_bytes()
+        except OSError as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+
+        file_format = kwargs["format"] or path.suffix.lstrip(".").lower()
+        images = Path(kwargs["images"]) if kwargs["images"] else path.parent
+        start = time.perf_counter()
+        try:
+            rows = list(imports.read_rows(data, file_format))
+        except ValueError as e:
+            raise CommandError(str(e))
+        report = imports.import_products(
+            rows,
+            customer,
+            imports.directory_images(images),
+            batch_size=kwargs["batch_size"],
+            dry_run=kwargs["dry_run"],
+        )
+        elapsed = time.perf_counter() - start
+
+        if kwargs["report"]:
+            Path(kwargs["report"]).write_text(json.dumps(report, indent=2) + "\n")
+        for entry in report:
+            if entry["status"] in ("invalid", "failed"):
+                self.stderr.write(
+                    f"Row {entry['row']} {entry['status']}: "
+                    + "; ".join(entry["errors"])
+                )
+        summary = imports.summarize(report)
+        self.stdout.write(
+            self.style.SUCCESS(
+                ", ".join(f"{total} {status}" for status, total in summary.items())
+                + f" in {elapsed:.1f}s."
+            )
+        )
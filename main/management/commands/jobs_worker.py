@@ -0,0 +1,68 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from main import jobs
+
+
+class Command(BaseCommand):
+    help = "Processes queued background jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.JOB_BATCH_SIZE,
+            help="Jobs claimed per poll.",
+        )
+        parser.add_argument(
+            "--task",
+            action="append",
+            dest="tasks",
+            help="Only process jobs of this task; repeat for several.",
+        )
+        parser.add_argument(
+            "--exclude-task",
+            action="append",
+            dest="exclude",
+            help="Process jobs of every task but this one; repeat for several.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no job is due instead of polling.",
+        )
+        parser.add_argument(
+            "--retry-dead",
+            action="store_true",
+            help="Queue dead-lettered jobs again before starting.",
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["retry_dead"]:
+            self.stdout.write(f"Requeued {jobs.retry_dead()} dead jobs")
+
+        self.stdout.write("Started job worker")
+        try:
+            while True:
+                close_old_connections()
+                batch = jobs.work(
+                    kwargs["batch_size"], kwargs["tasks"], kwargs["exclude"]
+                )
+                for job in batch:
+                    self.report(job)
+                if not batch:
+                    if kwargs["once"]:
+                        break
+                    time.sleep(settings.JOB_POLL_INTERVAL)
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS("Job worker stopped."))
+
+    def report(self, job):
+        if job.status == "done":
+            self.stdout.write(f"{job}")
+        else:
+            self.stdout.write(f"\033[91m{job}: {job.error}\033[0m")
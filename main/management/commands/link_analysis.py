@@ -1,90 +1,159 @@
+import asyncio
+
 from django.core.management.base import BaseCommand
-from main.models import Product, Brand, Category
-import requests
+from django.utils import timezone
+from main.links import (
+    BASE_URL,
+    LinkChecker,
+    broken_links,
+    check_links,
+    claim_run,
+    count_links,
+    create_run,
+    iter_incremental_links,
+    iter_links,
+    last_run,
+    prune_links,
+    record_results,
+    summarize,
+)
+from main.models import LinkAnalysisRun
 
 
 class Command(BaseCommand):
     help = "Performs link analysis on products and brands."
 
-    def handle(self, *args, **kwargs):
-        self.stdout.write("Started Cron Job for Link Analysis")
-
-        products = Product.objects.only("slug")
-        brands = Brand.objects.only("slug")
-        categories = Category.objects.only("slug")
-
-        base_url = "https://rarecraft.onrender.com"
-
-        static_paths = ["/", "/products", "/signin", "/register", "/contact"]
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default=BASE_URL)
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=20,
+            help="Maximum number of links checked at the same time.",
+        )
+        parser.add_argument(
+            "--timeout", type=float, default=10, help="Timeout for dynamic pages."
+        )
+        parser.add_argument(
+            "--static-timeout",
+            type=float,
+            default=60,
+            help="Timeout for static pages.",
+        )
+        parser.add_argument(
+            "--retries",
+            type=int,
+            default=2,
+            help="Retries after a network error, 429 or 5xx response.",
+        )
+        parser.add_argument(
+            "--backoff",
+            type=float,
+            default=0.5,
+            help="Initial retry delay in seconds, doubled on every retry.",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only check links of objects changed since the last run, "
+            "plus a sample of the least recently checked links.",
+        )
+        parser.add_argument(
+            "--sample",
+            type=int,
+            default=500,
+            help="Unchanged links re-checked by an incremental run.",
+        )
+        parser.add_argument(
+            "--run-id",
+            type=int,
+            help="Run a link analysis queued by the run_link_analysis endpoint.",
+        )
 
-        for path in static_paths:
-            try:
-                url = f"{base_url}{path}"
-                response = requests.head(url, timeout=60)
-                if response.status_code != 200:
-                    self.stdout.write(f"\033[91mBroken link found: {url}\033[0m")
-                else:
-                    self.stdout.write(f"Status 200: {url}")
-            except requests.RequestException as e:
-                self.stdout.write(f"\033[91mError checking link for {path}: {e}\033[0m")
-
-        # dynamic_paths
-        for product in products:
-            try:
-                product_url = f"{base_url}/product/{product.slug}"
-                response = requests.head(product_url, timeout=10)
-                if response.status_code != 200:
-                    self.stdout.write(
-                        f"\033[91mBroken link found: {product_url}\033[0m"
-                    )
-                else:
-                    self.stdout.write(f"Status 200: {product_url}")
-            except requests.RequestException as e:
+    def handle(self, *args, **kwargs):
+        if kwargs["run_id"]:
+            if not claim_run(kwargs["run_id"]):
+                self.stdout.write(f"Link analysis #{kwargs['run_id']} is not pending.")
+                return
+            run = LinkAnalysisRun.objects.get(id=kwargs["run_id"])
+        else:
+            run, created = create_run(kwargs["incremental"], status="running")
+            if not created:
                 self.stdout.write(
-                    f"\033[91mError checking link for product {product.slug}: {e}\033[0m"
+                    self.style.WARNING(
+                        f"Link analysis #{run.id} is already {run.status}."
+                    )
                 )
+                return
 
-        for brand in brands:
-            try:
-                brand_url = f"{base_url}/brand/{brand.slug}"
-                response = requests.head(brand_url, timeout=10)
-                if response.status_code != 200:
-                    self.stdout.write(f"\033[91mBroken link found: {brand_url}\033[0m")
-                else:
-                    self.stdout.write(f"Status 200: {brand_url}")
-            except requests.RequestException as e:
-                self.stdout.write(
-                    f"\033[91mError checking link for brand {brand.slug}: {e}\033[0m"
-                )
+        try:
+            self.analyse(run, kwargs)
+        except BaseException as e:
+            run.status = "failed"
+            run.error = str(e) or repr(e)
+            run.finished_at = timezone.now()
+            run.save()
+            raise
 
-        for brand in brands:
-            try:
-                brand_products_url = f"{base_url}/products/brand/{brand.slug}"
-                response = requests.head(brand_products_url, timeout=10)
-                if response.status_code != 200:
-                    self.stdout.write(
-                        f"\033[91mBroken link found: {brand_products_url}\033[0m"
-                    )
-                else:
-                    self.stdout.write(f"Status 200: {brand_products_url}")
-            except requests.RequestException as e:
-                self.stdout.write(
-                    f"\033[91mError checking link for brand products {brand.slug}: {e}\033[0m"
-                )
+    def analyse(self, run, kwargs):
+        self.stdout.write("Started Cron Job for Link Analysis")
 
-        for category in categories:
-            try:
-                category_products_url = f"{base_url}/products/category/{category.slug}"
-                response = requests.head(category_products_url, timeout=10)
-                if response.status_code != 200:
-                    self.stdout.write(
-                        f"\033[91mBroken link found: {category_products_url}\033[0m"
-                    )
-                else:
-                    self.stdout.write(f"Status 200: {category_products_url}")
-            except requests.RequestException as e:
-                self.stdout.write(
-                    f"\033[91mError checking link for category products {category.slug}: {e}\033[0m"
-                )
+        checker = LinkChecker(
+            concurrency=kwargs["concurrency"],
+            timeout=kwargs["timeout"],
+            retries=kwargs["retries"],
+            backoff=kwargs["backoff"],
+            on_result=self.report,
+        )
+        base_url = kwargs["base_url"].rstrip("/")
+        previous = last_run() if run.incremental else None
+        run.incremental = previous is not None
+        if previous is not None:
+            self.stdout.write(f"Checking links changed since {previous.started_at}")
+            run.total = count_links(previous.started_at, kwargs["sample"])
+            links = iter_incremental_links(
+                previous.started_at,
+                kwargs["sample"],
+                base_url,
+                static_timeout=kwargs["static_timeout"],
+            )
+        else:
+            run.total = count_links()
+            links = iter_links(base_url, static_timeout=kwargs["static_timeout"])
+        run.save(update_fields=["incremental", "total", "updated_at"])
+        results = asyncio.run(check_links(checker, links, run))
+
+        record_results(results, run)
+        pruned = prune_links(run)
+        run.checked = len(results)
+        run.broken = sum(not result.ok for result in results)
+        run.status = "done"
+        run.finished_at = timezone.now()
+        run.save()
+
+        summary = summarize(results)
+        self.stdout.write(
+            f"Checked {summary['total']} links: {summary['ok']} ok, "
+            f"{len(summary['broken'])} broken. Latency p50 "
+            f"{summary['latency_p50']:.3f}s, p95 {summary['latency_p95']:.3f}s, "
+            f"max {summary['latency_max']:.3f}s"
+        )
+        for result in summary["broken"]:
+            reason = result.status or result.error
+            self.stdout.write(f"\033[91m  {result.link.url} ({reason})\033[0m")
+        if pruned:
+            self.stdout.write(f"Removed {pruned} links that no longer exist.")
+        self.stdout.write(f"{broken_links().count()} links are currently broken.")
 
         self.stdout.write(self.style.SUCCESS("Link analysis completed."))
+
+    def report(self, result):
+        url = result.link.url
+        if result.ok:
+            self.stdout.write(f"Status 200: {url}")
+        elif result.status is None:
+            self.stdout.write(
+                f"\033[91mError checking link for {url}: {result.error}\033[0m"
+            )
+        else:
+            self.stdout.write(f"\033[91mBroken link found: {url}\033[0m")
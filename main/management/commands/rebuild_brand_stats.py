@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from main.stats import rebuild_brand_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the denormalized brand statistics from scratch."
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            total = rebuild_brand_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {total} brands."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from main.models import Product
+from main.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search vectors of all products."
+
+    def handle(self, *args, **kwargs):
+        total = update_search_vectors(Product.objects.all())
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt search vectors for {total} products.")
+        )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from main.models import StorageCleanupJob
+from main.storage import pending_cleanup_jobs, run_cleanup_job
+
+
+class Command(BaseCommand):
+    help = "Runs pending or interrupted storage cleanup jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retry-failed",
+            action="store_true",
+            help="Also resume jobs that previously failed.",
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs["retry_failed"]:
+            StorageCleanupJob.objects.filter(status="failed").update(
+                status="pending", error=""
+            )
+
+        for job in pending_cleanup_jobs():
+            if not run_cleanup_job(job.id):
+                continue
+            job.refresh_from_db()
+            self.stdout.write(f"{job}: {job.processed}/{job.total} folders cleaned up")
+
+        self.stdout.write(self.style.SUCCESS("Storage cleanup completed."))
@@ -0,0 +1,126 @@
+import contextvars
+import re
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+_checkouts = contextvars.ContextVar("connection_checkouts", default=None)
+
+
+# Request metrics
+#
+# Query count, time per category (db, serializer, storage) and query shapes
+# of one sampled request, collected by main.middleware.request_metrics.
+# Queries are recorded with the parameters left out, so a shape executed
+# over and over is a suspected N+1.
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.timings = defaultdict(float)
+        self.depth = defaultdict(int)
+        self.statements = Counter()
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.timings["db"] += time.perf_counter() - start
+            self.queries += 1
+            self.statements[sql] += 1
+
+    # Query shapes run at least threshold times, most repeated first.
+    # IN lists are collapsed, so prefetches of different sizes are one shape.
+    def repeated_queries(self, threshold):
+        shapes = Counter()
+        for sql, count in self.statements.items():
+            shapes[IN_LIST.sub("IN (...)", sql)] += count
+        return [
+            (sql, count) for sql, count in shapes.most_common() if count >= threshold
+        ]
+
+
+def current():
+    return _current.get()
+
+
+# Execute wrapper of every connection (main.backends.postgresql), so the
+# queries of async views, which run on another thread's connection, are
+# recorded too
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.record_query(execute, sql, params, many, context)
+
+
+@contextmanager
+def collect():
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+# Adds the time spent in the block to the request's name timing. Nested
+# blocks of the same name are counted once, by the outermost.
+@contextmanager
+def timer(name):
+    metrics = _current.get()
+    if metrics is None or metrics.depth[name]:
+        yield
+        return
+    metrics.depth[name] += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timings[name] += time.perf_counter() - start
+        metrics.depth[name] -= 1
+
+
+def timed(name):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# Connection checkouts
+#
+# Kept apart from the sampled metrics: main.middleware.db_pool_metrics
+# reports them on every request. Like the queries, checkouts are recorded
+# through a context variable because async views use another thread's
+# connection.
+class Checkouts:
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+
+@contextmanager
+def collect_checkouts():
+    checkouts = Checkouts()
+    token = _checkouts.set(checkouts)
+    try:
+        yield checkouts
+    finally:
+        _checkouts.reset(token)
+
+
+def record_checkout(duration):
+    checkouts = _checkouts.get()
+    if checkouts is not None:
+        checkouts.count += 1
+        checkouts.time += duration
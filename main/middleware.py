@@ -0,0 +1,129 @@
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.utils.decorators import sync_and_async_middleware
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def add_server_timing(response, entries):
+    if not entries:
+        return
+    existing = response.headers.get("Server-Timing")
+    response.headers["Server-Timing"] = ", ".join(
+        ([existing] if existing else []) + entries
+    )
+
+
+# Database pool metrics
+#
+# Server-Timing entries for the request's connection checkouts:
+# db-checkout is the time spent waiting for connections, db-pool the pool's
+# saturation when the response is ready (connections in use, including the
+# request's own, against the pool's maximum, and requests queued for one).
+def pool_timing(checkouts):
+    entries = [
+        f"db-checkout;dur={checkouts.time * 1000:.2f};"
+        f'desc="{checkouts.count} checkouts"'
+    ]
+    stats = connection.pool_stats() if hasattr(connection, "pool_stats") else None
+    if stats:
+        in_use = stats["pool_size"] - stats["pool_available"]
+        entries.append(
+            f'db-pool;desc="in_use={in_use} size={stats["pool_size"]} '
+            f'max={stats["pool_max"]} waiting={stats["requests_waiting"]} '
+            f'saturation={in_use / stats["pool_max"]:.0%}"'
+        )
+    return entries
+
+
+@sync_and_async_middleware
+def db_pool_metrics(get_response):
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            with metrics.collect_checkouts() as checkouts:
+                response = await get_response(request)
+            add_server_timing(response, pool_timing(checkouts))
+            return response
+
+    else:
+
+        def middleware(request):
+            with metrics.collect_checkouts() as checkouts:
+                response = get_response(request)
+            add_server_timing(response, pool_timing(checkouts))
+            return response
+
+    return middleware
+
+
+# Request metrics
+#
+# For a METRICS_SAMPLE_RATE share of the requests: the query count and the
+# time spent in the database, serializers and storage, as Server-Timing
+# entries. Query shapes repeated METRICS_N_PLUS_ONE_THRESHOLD times or more
+# are logged as suspected N+1s and counted in an n-plus-one entry.
+# Unsampled requests only pay for a random() call.
+def metrics_timing(request, collected, elapsed):
+    timings = collected.timings
+    entries = [
+        f"total;dur={elapsed * 1000:.2f}",
+        f'db;dur={timings["db"] * 1000:.2f};desc="{collected.queries} queries"',
+        f"serializer;dur={timings['serializer'] * 1000:.2f}",
+        f"storage;dur={timings['storage'] * 1000:.2f}",
+    ]
+    repeated = collected.repeated_queries(settings.METRICS_N_PLUS_ONE_THRESHOLD)
+    if repeated:
+        for sql, count in repeated:
+            logger.warning(
+                "Suspected N+1 on %s %s: %d queries like %s",
+                request.method,
+                request.path,
+                count,
+                sql,
+            )
+        entries.append(
+            f'n-plus-one;desc="{len(repeated)} shapes, up to {repeated[0][1]}x"'
+        )
+    return entries
+
+
+def sampled():
+    rate = settings.METRICS_SAMPLE_RATE
+    return rate > 0 and (rate >= 1 or random.random() < rate)
+
+
+@sync_and_async_middleware
+def request_metrics(get_response):
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            if not sampled():
+                return await get_response(request)
+            start = time.perf_counter()
+            with metrics.collect() as collected:
+                response = await get_response(request)
+            elapsed = time.perf_counter() - start
+            add_server_timing(response, metrics_timing(request, collected, elapsed))
+            return response
+
+    else:
+
+        def middleware(request):
+            if not sampled():
+                return get_response(request)
+            start = time.perf_counter()
+            with metrics.collect() as collected:
+                response = get_response(request)
+            elapsed = time.perf_counter() - start
+            add_server_timing(response, metrics_timing(request, collected, elapsed))
+            return response
+
+    return middleware
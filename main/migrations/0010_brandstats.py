@@ -0,0 +1,51 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_brand_stats(apps, schema_editor):
+    Brand = apps.get_model('main', 'Brand')
+    BrandStats = apps.get_model('main', 'BrandStats')
+    Review = apps.get_model('main', 'Review')
+
+    reviews = {
+        row['product__brand']: row
+        for row in Review.objects.values('product__brand').annotate(
+            count=Count('id'), rating=Sum('rating')
+        )
+    }
+    stats = []
+    for brand in Brand.objects.annotate(product_count=Count('products')):
+        review_totals = reviews.get(brand.id, {})
+        stats.append(
+            BrandStats(
+                brand_id=brand.id,
+                product_count=brand.product_count,
+                review_count=review_totals.get('count', 0),
+                rating_sum=review_totals.get('rating') or 0,
+            )
+        )
+    BrandStats.objects.bulk_create(stats, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BrandStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveBigIntegerField(default=0)),
+                ('brand', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='main.brand')),
+            ],
+        ),
+        migrations.RunPython(populate_brand_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:58
+
+import django.contrib.postgres.fields
+import main.models
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_rating_summary(apps, schema_editor):
+    Product = apps.get_model('main', 'Product')
+    stars = range(1, 6)
+
+    products = Product.objects.annotate(
+        review_total=Count('reviews'),
+        rating_total=Sum('reviews__rating'),
+        **{
+            f'star_{star}': Count('reviews', filter=Q(reviews__rating=star))
+            for star in stars
+        },
+    ).filter(review_total__gt=0)
+    for product in products.iterator(chunk_size=1000):
+        product.rating_count = product.review_total
+        product.rating_avg = product.rating_total / product.review_total
+        product.rating_histogram = [getattr(product, f'star_{star}') for star in stars]
+        product.save(update_fields=['rating_count', 'rating_avg', 'rating_histogram'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_brandstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_histogram',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(), default=main.models.default_rating_histogram, size=5),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['rating_avg', 'id'], name='main_produc_rating__89f60c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['rating_count', 'id'], name='main_produc_rating__484dd4_idx'),
+        ),
+        migrations.RunPython(populate_rating_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def copy_likes(apps, schema_editor):
+    Customer = apps.get_model('main', 'Customer')
+    Review = apps.get_model('main', 'Review')
+    ReviewLike = apps.get_model('main', 'ReviewLike')
+
+    customer_ids = set(Customer.objects.values_list('id', flat=True))
+    reviews = Review.objects.exclude(legacy_likes=[]).only('id', 'legacy_likes')
+    for review in reviews.iterator(chunk_size=1000):
+        liked_by = set(review.legacy_likes) & customer_ids
+        ReviewLike.objects.bulk_create(
+            [ReviewLike(review_id=review.id, customer_id=id) for id in liked_by]
+        )
+        Review.objects.filter(id=review.id).update(like_count=len(liked_by))
+
+
+def restore_likes(apps, schema_editor):
+    Review = apps.get_model('main', 'Review')
+    ReviewLike = apps.get_model('main', 'ReviewLike')
+
+    legacy_likes = {}
+    for review_id, customer_id in ReviewLike.objects.values_list(
+        'review_id', 'customer_id'
+    ).order_by('id'):
+        legacy_likes.setdefault(review_id, []).append(customer_id)
+    for review_id, likes in legacy_likes.items():
+        Review.objects.filter(id=review_id).update(legacy_likes=likes)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_product_rating_summary'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='review',
+            old_name='likes',
+            new_name='legacy_likes',
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', 'like_count', 'id'], name='main_review_product_24bce2_idx'),
+        ),
+        migrations.CreateModel(
+            name='ReviewLike',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='review_likes', to='main.customer')),
+                ('review', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='likes', to='main.review')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('review', 'customer'), name='unique_review_like')],
+            },
+        ),
+        migrations.RunPython(copy_likes, restore_likes),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_reviewlike'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='review',
+            name='legacy_likes',
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:01
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.functions.text
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def populate_search_vector(apps, schema_editor):
+    Brand = apps.get_model('main', 'Brand')
+    Product = apps.get_model('main', 'Product')
+
+    brand_name = Brand.objects.filter(id=OuterRef('brand_id')).values('name')
+    tag_names = (
+        Product.tags.through.objects.filter(product_id=OuterRef('pk'))
+        .values('product_id')
+        .annotate(names=StringAgg('producttag__name', delimiter=' '))
+        .values('names')
+    )
+    Product.objects.update(
+        search_vector=SearchVector('name', weight='A', config='english')
+        + SearchVector(Subquery(brand_name), weight='B', config='english')
+        + SearchVector(Subquery(tag_names), weight='B', config='english')
+        + SearchVector('description', weight='C', config='english')
+        + SearchVector('content', weight='D', config='english')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_remove_review_legacy_likes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='main_produc_search__4ed833_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='main_product_name_trgm'),
+        ),
+        migrations.RunPython(populate_search_vector, migrations.RunPython.noop),
+    ]
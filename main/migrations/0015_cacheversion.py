@@ -0,0 +1,28 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:03
+
+from django.db import migrations, models
+
+
+def create_versions(apps, schema_editor):
+    CacheVersion = apps.get_model('main', 'CacheVersion')
+    CacheVersion.objects.bulk_create(
+        [CacheVersion(name=name) for name in ('product', 'brand', 'category')]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(create_versions, migrations.RunPython.noop),
+    ]
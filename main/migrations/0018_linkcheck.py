@@ -0,0 +1,54 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_storagecleanupjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LinkAnalysisRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('incremental', models.BooleanField(default=False)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('checked', models.PositiveIntegerField(default=0)),
+                ('broken', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LinkCheck',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(max_length=1000, unique=True)),
+                ('kind', models.CharField(max_length=30)),
+                ('slug', models.CharField(blank=True, max_length=200)),
+                ('status', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('latency', models.FloatField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('last_checked', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_changed', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_checked'], name='main_linkch_last_ch_2ea654_idx'), models.Index(fields=['kind', 'slug'], name='main_linkch_kind_4ef448_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LinkCheckHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('link', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='history', to='main.linkcheck')),
+                ('run', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='main.linkanalysisrun')),
+            ],
+        ),
+    ]
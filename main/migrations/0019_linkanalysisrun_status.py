@@ -0,0 +1,44 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+def set_status(apps, schema_editor):
+    LinkAnalysisRun = apps.get_model('main', 'LinkAnalysisRun')
+    LinkAnalysisRun.objects.filter(finished_at__isnull=False).update(status='done')
+    LinkAnalysisRun.objects.filter(finished_at__isnull=True).update(status='failed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_linkcheck'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='linkanalysisrun',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='linkanalysisrun',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.RunPython(set_status, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='linkanalysisrun',
+            name='total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='linkanalysisrun',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddConstraint(
+            model_name='linkanalysisrun',
+            constraint=models.UniqueConstraint(models.Value(True), condition=models.Q(('status__in', ['pending', 'running'])), name='unique_active_link_analysis_run'),
+        ),
+    ]
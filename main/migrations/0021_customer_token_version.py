@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0020_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='token_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0021_customer_token_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='linkcheck',
+            name='slug',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+    ]
@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models.functions import Upper
 from django.contrib.auth.models import User
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.utils import timezone
 
 
@@ -9,6 +12,8 @@ class Customer(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     mobile = models.PositiveBigIntegerField(null=True, blank=True, unique=True)
     image = models.CharField(max_length=1000)
+    # part of issued tokens, bumped to revoke them
+    token_version = models.PositiveIntegerField(default=1)
 
     def __str__(self):
         return self.user.username
@@ -19,6 +24,7 @@ class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=100, unique=True)
     image = models.CharField(max_length=1000)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -31,11 +37,33 @@ class Brand(models.Model):
     slug = models.SlugField(max_length=100, unique=True)
     description = models.TextField()
     image = models.CharField(max_length=1000)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
 
+# Brand Stats (maintained incrementally, see main/stats.py)
+class BrandStats(models.Model):
+    brand = models.OneToOneField(
+        Brand,
+        on_delete=models.CASCADE,
+        related_name="stats",
+    )
+    product_count = models.PositiveIntegerField(default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveBigIntegerField(default=0)
+
+    @property
+    def avg_rating(self):
+        if not self.review_count:
+            return 0.0
+        return self.rating_sum / self.review_count
+
+    def __str__(self):
+        return f"Stats for {self.brand_id}"
+
+
 # Product
 class ProductTag(models.Model):
     name = models.CharField(max_length=50, unique=True)
@@ -44,6 +72,10 @@ class ProductTag(models.Model):
         return self.name
 
 
+def default_rating_histogram():
+    return [0, 0, 0, 0, 0]
+
+
 # Product
 class Product(models.Model):
     vendor = models.ForeignKey(
@@ -75,6 +107,15 @@ class Product(models.Model):
     details = models.JSONField(default=list)
     images = ArrayField(models.CharField(max_length=1000), default=list)
     created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    # rating summary (maintained by main/stats.py)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_avg = models.FloatField(default=0)
+    rating_histogram = ArrayField(
+        models.PositiveIntegerField(), size=5, default=default_rating_histogram
+    )
+    # weighted full-text document (maintained by main/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -82,6 +123,17 @@ class Product(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=["category", "brand", "price"]),
+            # keyset pagination orderings, scanned in either direction
+            models.Index(fields=["name", "id"]),
+            models.Index(fields=["price", "id"]),
+            models.Index(fields=["created_at", "id"]),
+            models.Index(fields=["rating_avg", "id"]),
+            models.Index(fields=["rating_count", "id"]),
+            GinIndex(fields=["search_vector"]),
+            GinIndex(
+                OpClass(Upper("name"), name="gin_trgm_ops"),
+                name="main_product_name_trgm",
+            ),
         ]
 
 
@@ -93,8 +145,218 @@ class Review(models.Model):
     review_by = models.CharField(max_length=100)
     rating = models.PositiveSmallIntegerField()
     review = models.TextField()
-    likes = ArrayField(models.PositiveIntegerField(), default=list)
+    like_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Review by {self.review_by} on {self.product.name}"
+
+    class Meta:
+        indexes = [
+            # reviews of a product sorted by helpfulness
+            models.Index(fields=["product", "like_count", "id"]),
+        ]
+
+
+# Review Like
+class ReviewLike(models.Model):
+    review = models.ForeignKey(Review, on_delete=models.CASCADE, related_name="likes")
+    customer = models.ForeignKey(
+        Customer, on_delete=models.CASCADE, related_name="review_likes"
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Like by {self.customer_id} on review {self.review_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["review", "customer"], name="unique_review_like"
+            ),
+        ]
+
+    @classmethod
+    def toggle(cls, review_id, customer_id):
+        # Likes or unlikes a review and keeps Review.like_count in step in a
+        # single statement, returning (liked, like_count), or None when the
+        # review is gone. Racing double clicks hit the unique constraint and
+        # are dropped by ON CONFLICT, so like_count can never drift. liked is
+        # the state after the write: unless this call removed the like, the
+        # row exists, whether it inserted it or a racing click did.
+        sql = f"""
+            WITH removed AS (
+                DELETE FROM {cls._meta.db_table}
+                WHERE review_id = %(review)s AND customer_id = %(customer)s
+                RETURNING 1
+            ), added AS (
+                INSERT INTO {cls._meta.db_table} (review_id, customer_id, created_at)
+                SELECT %(review)s, %(customer)s, now()
+                WHERE NOT EXISTS (SELECT 1 FROM removed)
+                AND EXISTS (SELECT 1 FROM {Review._meta.db_table} WHERE id = %(review)s)
+                ON CONFLICT DO NOTHING
+                RETURNING 1
+            )
+            UPDATE {Review._meta.db_table}
+            SET like_count = like_count
+                + (SELECT count(*) FROM added)
+                - (SELECT count(*) FROM removed),
+                updated_at = now()
+            WHERE id = %(review)s
+            RETURNING NOT EXISTS (SELECT 1 FROM removed), like_count
+        """
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, {"review": review_id, "customer": customer_id})
+                return cursor.fetchone()
+        except IntegrityError:
+            # The review was deleted while the like was inserted
+            return None
+
+
+# Cache Version (bumped on writes, part of every response cache key)
+class CacheVersion(models.Model):
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+# Storage Cleanup Job (background removal of deleted objects' files)
+class StorageCleanupJob(models.Model):
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+
+    customer = models.ForeignKey(
+        Customer, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    description = models.CharField(max_length=200)
+    folders = ArrayField(models.CharField(max_length=200), default=list)
+    processed = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.description} ({self.status})"
+
+    @property
+    def total(self):
+        return len(self.folders)
+
+
+# Link Analysis Run (at most one pending or running at a time)
+class LinkAnalysisRun(models.Model):
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+    ACTIVE_STATUSES = ["pending", "running"]
+
+    incremental = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    total = models.PositiveIntegerField(default=0)
+    checked = models.PositiveIntegerField(default=0)
+    broken = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                models.Value(True),
+                condition=models.Q(status__in=["pending", "running"]),
+                name="unique_active_link_analysis_run",
+            )
+        ]
+
+    def __str__(self):
+        kind = "Incremental" if self.incremental else "Full"
+        return f"{kind} link analysis at {self.started_at} ({self.status})"
+
+
+# Link Check (latest result for every public URL)
+class LinkCheck(models.Model):
+    url = models.CharField(max_length=1000, unique=True)
+    kind = models.CharField(max_length=30)
+    slug = models.CharField(max_length=500, blank=True)
+    status = models.PositiveSmallIntegerField(null=True, blank=True)
+    latency = models.FloatField(default=0)
+    error = models.TextField(blank=True)
+    last_checked = models.DateTimeField(default=timezone.now)
+    last_changed = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["last_checked"]),
+            models.Index(fields=["kind", "slug"]),
+        ]
+
+    def __str__(self):
+        return f"{self.url} ({self.status or self.error})"
+
+    @property
+    def ok(self):
+        return self.status == 200
+
+
+# Link Check History (one row per status change of a URL)
+class LinkCheckHistory(models.Model):
+    link = models.ForeignKey(
+        LinkCheck, on_delete=models.CASCADE, related_name="history"
+    )
+    run = models.ForeignKey(
+        LinkAnalysisRun, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    status = models.PositiveSmallIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.link.url}: {self.status or self.error}"
+
+
+# Job (background work queue, claimed with SELECT ... FOR UPDATE SKIP LOCKED)
+class Job(models.Model):
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("dead", "Dead"),
+    ]
+
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["run_at", "id"],
+                condition=models.Q(status="queued"),
+                name="main_job_queued_idx",
+            ),
+            models.Index(fields=["status", "locked_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.id} ({self.status})"
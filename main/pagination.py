@@ -0,0 +1,155 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+# Keyset (seek) pagination
+#
+# The view provides an ordering ending in a unique tie-breaker ("id"), the
+# cursor stores the values of the last row on the page, and the next page is
+# fetched with a WHERE clause on those values instead of an OFFSET, so every
+# page costs the same as the first one.
+class KeysetPagination(BasePagination):
+    page_size = 24
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        if queryset is None:
+            return None
+        return self.set_page([obj async for obj in queryset])
+
+    # The page plus one row, which tells whether there is a next page
+    def get_page_queryset(self, queryset, request, view):
+        # Pagination is opt-in so clients fetching the whole list keep working
+        if (
+            self.cursor_query_param not in request.query_params
+            and self.page_size_query_param not in request.query_params
+        ):
+            return None
+
+        self.request = request
+        self.ordering = tuple(view.get_ordering())
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            values = self.decode_cursor(cursor, queryset)
+            queryset = queryset.filter(self.get_keyset_filter(values))
+        return queryset[: self.page_size + 1]
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.page_size
+        results = results[: self.page_size]
+        self.next_values = (
+            self.get_row_values(results[-1]) if self.has_next and results else None
+        )
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size < 1:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if self.next_values is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.next_values)
+        )
+        return replace_query_param(url, self.page_size_query_param, self.page_size)
+
+    def get_keyset_filter(self, values):
+        # (a, b, id) > (x, y, z) expanded as
+        # a > x OR (a = x AND b > y) OR (a = x AND b = y AND id > z)
+        # with the comparison flipped for descending fields.
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def get_row_values(self, obj):
+        values = []
+        for field in self.ordering:
+            value = obj
+            for attr in field.lstrip("-").split("__"):
+                value = getattr(value, attr)
+            values.append(value)
+        return values
+
+    def encode_cursor(self, values):
+        payload = json.dumps([self.to_json(value) for value in values])
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    # Every value is converted by its field, and ordering columns are never
+    # null, so a crafted cursor is a 404 rather than a failing query
+    def decode_cursor(self, cursor, queryset):
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            values = [
+                self.to_python(queryset, field.lstrip("-"), value)
+                for field, value in zip(self.ordering, values)
+            ]
+            if None in values:
+                raise ValueError
+            return values
+        except (ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def to_json(self, value):
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+    def to_python(self, queryset, name, value):
+        if value is None:
+            return None
+        # Annotations (e.g. search rank) by their output field
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field.to_python(value)
+
+        model = queryset.model
+        *relations, attr = name.split("__")
+        try:
+            for relation in relations:
+                model = model._meta.get_field(relation).related_model
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            raise ValueError
+        return field.to_python(value)
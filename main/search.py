@@ -0,0 +1,59 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramWordSimilarity,
+)
+from django.db.models import F, FloatField, OuterRef, Q, Subquery
+from django.db.models.functions import Cast, Upper
+
+from . import models
+
+SEARCH_CONFIG = "english"
+
+
+# Weighted document: name (A), brand name and tags (B), description (C),
+# content (D). Brand and tags live in other tables so the vector is stored on
+# Product and refreshed on writes instead of being a generated column.
+def product_search_vector():
+    brand_name = models.Brand.objects.filter(id=OuterRef("brand_id")).values("name")
+    tag_names = (
+        models.Product.tags.through.objects.filter(product_id=OuterRef("pk"))
+        .values("product_id")
+        .annotate(names=StringAgg("producttag__name", delimiter=" "))
+        .values("names")
+    )
+    return (
+        SearchVector("name", weight="A", config=SEARCH_CONFIG)
+        + SearchVector(Subquery(brand_name), weight="B", config=SEARCH_CONFIG)
+        + SearchVector(Subquery(tag_names), weight="B", config=SEARCH_CONFIG)
+        + SearchVector("description", weight="C", config=SEARCH_CONFIG)
+        + SearchVector("content", weight="D", config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(products):
+    return products.update(search_vector=product_search_vector())
+
+
+def search_products(queryset, text):
+    query = SearchQuery(text, search_type="websearch", config=SEARCH_CONFIG)
+    # Full-text matches, plus the old substring match on name and a trigram
+    # match for typos. icontains compiles to UPPER(name) LIKE, so both name
+    # conditions are served by the trigram index on UPPER(name).
+    return (
+        queryset.alias(name_upper=Upper("name"))
+        .filter(
+            Q(search_vector=query)
+            | Q(name__icontains=text)
+            | Q(name_upper__trigram_word_similar=text)
+        )
+        .annotate(
+            search_rank=Cast(
+                SearchRank(F("search_vector"), query)
+                + TrigramWordSimilarity(text, "name_upper"),
+                FloatField(),
+            )
+        )
+    )
@@ -1,18 +1,36 @@
 from rest_framework import serializers
-from .models import Customer, Category, Brand, ProductTag, Product, Review
+from .models import (
+    Customer,
+    Category,
+    Brand,
+    BrandStats,
+    ProductTag,
+    Product,
+    Review,
+    LinkCheck,
+)
 from django.contrib.auth.models import User
-from django.db.models import Avg
+
+from . import metrics
+
+
+# Base of the serializers below: to_representation counts as serializer time
+# in the request metrics
+class ModelSerializer(serializers.ModelSerializer):
+    def to_representation(self, instance):
+        with metrics.timer("serializer"):
+            return super().to_representation(instance)
 
 
 # User Serializer (for Customer)
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(ModelSerializer):
     class Meta:
         model = User
         fields = ["id", "username", "email"]
 
 
 # Customer Serializer
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(ModelSerializer):
     user = UserSerializer(read_only=True)
 
     class Meta:
@@ -21,14 +39,14 @@ class CustomerSerializer(serializers.ModelSerializer):
 
 
 # Category Serializer
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(ModelSerializer):
     class Meta:
         model = Category
         fields = ["id", "name", "slug", "image"]
 
 
 # Brand Serializer
-class BrandSerializer(serializers.ModelSerializer):
+class BrandSerializer(ModelSerializer):
     total_products = serializers.SerializerMethodField()
     reviews = serializers.SerializerMethodField()
 
@@ -45,29 +63,35 @@ class BrandSerializer(serializers.ModelSerializer):
             "reviews",
         ]
 
+    # Querysets should select_related("stats") to keep these query-free
+    def get_stats(self, obj):
+        try:
+            return obj.stats
+        except BrandStats.DoesNotExist:
+            return BrandStats(brand=obj)
+
     def get_total_products(self, obj):
-        return obj.products.count()
+        return self.get_stats(obj).product_count
 
     def get_reviews(self, obj):
-        avg_review = obj.products.aggregate(Avg("reviews__rating"))[
-            "reviews__rating__avg"
-        ]
-        total_reviews = Review.objects.filter(product__brand=obj).count()
+        stats = self.get_stats(obj)
         return {
-            "avg_review": avg_review if avg_review is not None else 0.0,
-            "total_reviews": total_reviews,
+            "avg_review": stats.avg_rating,
+            "total_reviews": stats.review_count,
         }
 
 
 # ProductTag Serializer
-class ProductTagSerializer(serializers.ModelSerializer):
+class ProductTagSerializer(ModelSerializer):
     class Meta:
         model = ProductTag
         fields = ["id", "name"]
 
 
 # Review Serializer
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(ModelSerializer):
+    likes = serializers.SerializerMethodField()
+
     class Meta:
         model = Review
         fields = [
@@ -77,16 +101,30 @@ class ReviewSerializer(serializers.ModelSerializer):
             "rating",
             "review",
             "likes",
+            "like_count",
             "created_at",
         ]
+        read_only_fields = ["like_count"]
+
+    # Querysets should prefetch_related("likes")
+    def get_likes(self, obj):
+        return [like.customer_id for like in obj.likes.all()]
 
 
 # Product Serializer
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(ModelSerializer):
     brand = BrandSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
     tags = ProductTagSerializer(many=True, read_only=True)
     reviews = ReviewSerializer(many=True, read_only=True)
+    rating = serializers.SerializerMethodField()
+
+    # fields: optional subset of field names to render
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
     class Meta:
         model = Product
@@ -105,4 +143,54 @@ class ProductSerializer(serializers.ModelSerializer):
             "reviews",
             "images",
             "created_at",
+            "rating",
+        ]
+
+    def get_rating(self, obj):
+        return {
+            "average": obj.rating_avg,
+            "count": obj.rating_count,
+            "histogram": {
+                str(star): total
+                for star, total in enumerate(obj.rating_histogram, start=1)
+            },
+        }
+
+
+# Product Card Serializer (compact representation for list endpoints)
+class ProductCardSerializer(ModelSerializer):
+    image = serializers.SerializerMethodField()
+    brand_name = serializers.CharField(source="brand.name", read_only=True)
+
+    class Meta:
+        model = Product
+        fields = [
+            "id",
+            "name",
+            "slug",
+            "price",
+            "discount",
+            "image",
+            "rating_avg",
+            "rating_count",
+            "brand_name",
+        ]
+
+    def get_image(self, obj):
+        return obj.images[0] if obj.images else None
+
+
+# Link Check Serializer
+class LinkCheckSerializer(ModelSerializer):
+    class Meta:
+        model = LinkCheck
+        fields = [
+            "url",
+            "kind",
+            "slug",
+            "status",
+            "error",
+            "latency",
+            "last_checked",
+            "last_changed",
         ]
@@ -0,0 +1,98 @@
+from dataclasses import dataclass
+from datetime import timezone
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import F, Max
+
+from .links import STATIC_PATHS
+from .models import Brand, Category, Product
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+XMLNS = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+
+
+@dataclass
+class Section:
+    model: type
+    paths: list
+    namespace: str
+
+    # Objects per shard, so a shard never exceeds SITEMAP_MAX_URLS URLs
+    @property
+    def shard_size(self):
+        return settings.SITEMAP_MAX_URLS // len(self.paths)
+
+    def shard_range(self, page):
+        return (page - 1) * self.shard_size + 1, page * self.shard_size
+
+
+SECTIONS = {
+    "products": Section(Product, ["/product/{slug}"], "product"),
+    "brands": Section(Brand, ["/brand/{slug}", "/products/brand/{slug}"], "brand"),
+    "categories": Section(Category, ["/products/category/{slug}"], "category"),
+}
+
+
+def w3c_date(value):
+    return value.astimezone(timezone.utc).isoformat(timespec="seconds")
+
+
+# Shards
+#
+# Shards are fixed id ranges of shard_size ids. Ids are unique, so a shard
+# holds at most shard_size objects however sparse the ids are, and the
+# non-empty shards with their lastmod come out of a single GROUP BY.
+def shards(section):
+    return (
+        section.model.objects.annotate(shard=(F("id") - 1) / section.shard_size + 1)
+        .values("shard")
+        .annotate(lastmod=Max("updated_at"))
+        .order_by("shard")
+        .values_list("shard", "lastmod")
+    )
+
+
+def shard_exists(section, page):
+    return page >= 1 and (
+        section.model.objects.filter(id__range=section.shard_range(page)).exists()
+    )
+
+
+# Index of every shard, shard_url(name, page) gives the absolute URL of one
+def iter_index(shard_url, chunk_size=2000):
+    yield XML_HEADER
+    yield f"<sitemapindex {XMLNS}>\n"
+    yield f"<sitemap><loc>{escape(shard_url('static', 1))}</loc></sitemap>\n"
+    for name, section in SECTIONS.items():
+        for page, lastmod in shards(section).iterator(chunk_size=chunk_size):
+            yield (
+                f"<sitemap><loc>{escape(shard_url(name, page))}</loc>"
+                f"<lastmod>{w3c_date(lastmod)}</lastmod></sitemap>\n"
+            )
+    yield "</sitemapindex>\n"
+
+
+def iter_static(site_url):
+    yield XML_HEADER
+    yield f"<urlset {XMLNS}>\n"
+    for path in STATIC_PATHS:
+        yield f"<url><loc>{escape(site_url + path)}</loc></url>\n"
+    yield "</urlset>\n"
+
+
+# URLs of one shard, streamed from a server-side cursor
+def iter_shard(section, page, site_url, chunk_size=2000):
+    rows = (
+        section.model.objects.filter(id__range=section.shard_range(page))
+        .order_by("id")
+        .values_list("slug", "updated_at")
+    )
+    yield XML_HEADER
+    yield f"<urlset {XMLNS}>\n"
+    for slug, updated_at in rows.iterator(chunk_size=chunk_size):
+        lastmod = w3c_date(updated_at)
+        for path in section.paths:
+            loc = escape(site_url + path.format(slug=slug))
+            yield f"<url><loc>{loc}</loc><lastmod>{lastmod}</lastmod></url>\n"
+    yield "</urlset>\n"
@@ -0,0 +1,126 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import models
+
+RATING_STARS = range(1, 6)
+
+
+# Brand stats
+def update_brand_stats(brand_id, products=0, reviews=0, rating=0):
+    updated = models.BrandStats.objects.filter(brand_id=brand_id).update(
+        product_count=F("product_count") + products,
+        review_count=F("review_count") + reviews,
+        rating_sum=F("rating_sum") + rating,
+    )
+    if not updated:
+        # Brand created before stats existed, rebuild its row from scratch.
+        # On commit, as the change being counted (e.g. the delete of a
+        # removed product) may not have been made yet.
+        transaction.on_commit(lambda: rebuild_brand_stats(brand_ids=[brand_id]))
+
+
+def product_review_totals(product):
+    totals = product.reviews.aggregate(count=Count("id"), rating=Sum("rating"))
+    return totals["count"], totals["rating"] or 0
+
+
+def product_added(product):
+    update_brand_stats(product.brand_id, products=1)
+
+
+def product_removed(product):
+    count, rating = product_review_totals(product)
+    update_brand_stats(product.brand_id, products=-1, reviews=-count, rating=-rating)
+
+
+def product_moved(product, old_brand_id):
+    if product.brand_id == old_brand_id:
+        return
+    count, rating = product_review_totals(product)
+    update_brand_stats(old_brand_id, products=-1, reviews=-count, rating=-rating)
+    update_brand_stats(product.brand_id, products=1, reviews=count, rating=rating)
+
+
+def review_added(review, product):
+    update_brand_stats(product.brand_id, reviews=1, rating=review.rating)
+    refresh_product_rating(product.id)
+
+
+# Called once the review is deleted, in the same transaction
+def review_removed(review, product):
+    update_brand_stats(product.brand_id, reviews=-1, rating=-review.rating)
+    refresh_product_rating(product.id)
+
+
+# Product rating summary
+def product_rating_summary(reviews):
+    return reviews.aggregate(
+        count=Count("id"),
+        total=Sum("rating"),
+        **{f"star_{star}": Count("id", filter=Q(rating=star)) for star in RATING_STARS},
+    )
+
+
+def refresh_product_rating(product_id):
+    # The row lock serializes concurrent reviews on the same product, so the
+    # aggregate below always sees every committed review.
+    # Must be called inside a transaction.
+    models.Product.objects.select_for_update().filter(id=product_id).values("id").get()
+    summary = product_rating_summary(
+        models.Review.objects.filter(product_id=product_id)
+    )
+    count = summary["count"]
+    models.Product.objects.filter(id=product_id).update(
+        rating_count=count,
+        rating_avg=(summary["total"] or 0) / count if count else 0,
+        rating_histogram=[summary[f"star_{star}"] for star in RATING_STARS],
+        updated_at=timezone.now(),
+    )
+
+
+def rebuild_brand_stats(brand_ids=None):
+    brands = models.Brand.objects.all()
+    if brand_ids is not None:
+        brands = brands.filter(id__in=brand_ids)
+
+    product_count = (
+        models.Product.objects.filter(brand=OuterRef("pk"))
+        .values("brand")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    review_totals = models.Review.objects.filter(product__brand=OuterRef("pk")).values(
+        "product__brand"
+    )
+    brands = brands.annotate(
+        product_total=Coalesce(Subquery(product_count), Value(0)),
+        review_total=Coalesce(
+            Subquery(review_totals.annotate(total=Count("id")).values("total")),
+            Value(0),
+        ),
+        rating_total=Coalesce(
+            Subquery(review_totals.annotate(total=Sum("rating")).values("total")),
+            Value(0),
+        ),
+    ).values_list("id", "product_total", "review_total", "rating_total")
+
+    stats = [
+        models.BrandStats(
+            brand_id=brand_id,
+            product_count=products,
+            review_count=reviews,
+            rating_sum=rating,
+        )
+        for brand_id, products, reviews, rating in brands
+    ]
+    models.BrandStats.objects.bulk_create(
+        stats,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["brand"],
+        update_fields=["product_count", "review_count", "rating_sum"],
+    )
+    return len(stats)
@@ -0,0 +1,298 @@
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+import httpx
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import metrics, models
+
+
+# Supabase Storage over its REST API
+#
+# Bodies are streamed from the uploaded file in chunks and public URLs are
+# built locally. httpx.Client is thread-safe and keeps connections alive, so
+# one client serves every upload worker.
+class SupabaseStorage:
+    def __init__(self, url, key, bucket, timeout=60, max_connections=10):
+        self.base_url = f"{url.rstrip('/')}/storage/v1"
+        self.bucket = bucket
+        self.client = httpx.Client(
+            base_url=self.base_url,
+            headers={"apikey": key, "Authorization": f"Bearer {key}"},
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections),
+        )
+
+    def upload(self, path, chunks, size, content_type):
+        response = self.client.post(
+            f"/object/{self.bucket}/{path}",
+            content=chunks,
+            headers={
+                "content-type": content_type or "application/octet-stream",
+                "content-length": str(size),
+                "cache-control": "max-age=3600",
+                "x-upsert": "false",
+            },
+        )
+        if response.is_error:
+            raise ValueError(self.error_message(response))
+
+    def list(self, folder_path, page_size=100):
+        names, offset = [], 0
+        while True:
+            response = self.client.post(
+                f"/object/list/{self.bucket}",
+                json={
+                    "prefix": folder_path,
+                    "limit": page_size,
+                    "offset": offset,
+                    "sortBy": {"column": "name", "order": "asc"},
+                },
+            )
+            if response.is_error:
+                raise ValueError(self.error_message(response))
+            page = response.json()
+            names += [file_info["name"] for file_info in page]
+            if len(page) < page_size:
+                return names
+            offset += page_size
+
+    def remove(self, paths):
+        response = self.client.request(
+            "DELETE", f"/object/{self.bucket}", json={"prefixes": paths}
+        )
+        if response.is_error:
+            raise ValueError(self.error_message(response))
+
+    def public_url(self, path):
+        return f"{self.base_url}/object/public/{self.bucket}/{path}"
+
+    def error_message(self, response):
+        try:
+            return response.json().get("message", response.text)
+        except ValueError:
+            return response.text
+
+
+# Local filesystem stand-in for development and tests
+class LocalStorage:
+    def __init__(self, root, base_url):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+
+    def upload(self, path, chunks, size, content_type):
+        target = self.root / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(target, "xb") as destination:
+                for chunk in chunks:
+                    destination.write(chunk)
+        except FileExistsError:
+            raise ValueError("The resource already exists")
+
+    def list(self, folder_path):
+        folder = self.root / folder_path
+        if not folder.is_dir():
+            return []
+        return sorted(entry.name for entry in folder.iterdir())
+
+    def remove(self, paths):
+        for path in paths:
+            target = self.root / path
+            if target.is_dir():
+                shutil.rmtree(target)
+            else:
+                target.unlink(missing_ok=True)
+
+    def public_url(self, path):
+        return f"{self.base_url}/{path}"
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if settings.STORAGE_BACKEND == "local":
+                _storage = LocalStorage(
+                    settings.STORAGE_LOCAL_ROOT, settings.STORAGE_LOCAL_URL
+                )
+            else:
+                _storage = SupabaseStorage(
+                    settings.SUPABASE_URL,
+                    settings.SUPABASE_KEY,
+                    settings.STORAGE_BUCKET,
+                    max_connections=settings.STORAGE_UPLOAD_WORKERS,
+                )
+        return _storage
+
+
+def folder_path(folder_type, id):
+    return f"{folder_type}/{id}/"
+
+
+# Storage time of the request metrics covers the whole call, including the
+# upload and list workers
+@metrics.timed("storage")
+def upload_files(files, folder_type, id):
+    max_size = settings.STORAGE_MAX_UPLOAD_SIZE
+    for file in files:
+        if file.size > max_size:
+            raise ValueError(
+                f"Image '{file.name}' exceeds the maximum size of {max_size} bytes"
+            )
+
+    storage = get_storage()
+    paths = [
+        f"{folder_path(folder_type, id)}{index}_{file.name}"
+        for index, file in enumerate(files)
+    ]
+
+    def upload(path, file):
+        storage.upload(
+            path,
+            file.chunks(settings.STORAGE_CHUNK_SIZE),
+            file.size,
+            file.content_type,
+        )
+        return path
+
+    uploaded, errors = [], []
+    workers = max(1, min(settings.STORAGE_UPLOAD_WORKERS, len(files)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (file, executor.submit(upload, path, file))
+            for path, file in zip(paths, files)
+        ]
+        for file, future in futures:
+            try:
+                uploaded.append(future.result())
+            except Exception as e:
+                errors.append(f"Failed to upload image '{file.name}': {e}")
+
+    if errors:
+        # All or nothing: drop the images that did make it
+        if uploaded:
+            try:
+                storage.remove(uploaded)
+            except Exception as e:
+                print(f"Failed to roll back uploaded images: {e}")
+        raise ValueError("; ".join(errors))
+
+    return [storage.public_url(path) for path in paths]
+
+
+# Removes every file in the given folders with as few remove calls as
+# possible. Folders are listed concurrently.
+@metrics.timed("storage")
+def delete_folders(folders):
+    storage = get_storage()
+
+    def list_paths(folder):
+        return [f"{folder}{file_name}" for file_name in storage.list(folder)]
+
+    workers = max(1, min(settings.STORAGE_UPLOAD_WORKERS, len(folders)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        paths = [path for found in executor.map(list_paths, folders) for path in found]
+
+    remove_paths(paths)
+    return len(paths)
+
+
+def delete_folder(folder_type, id):
+    return delete_folders([folder_path(folder_type, id)])
+
+
+@metrics.timed("storage")
+def remove_paths(paths):
+    storage = get_storage()
+    batch_size = settings.STORAGE_REMOVE_BATCH_SIZE
+    for start in range(0, len(paths), batch_size):
+        storage.remove(paths[start : start + batch_size])
+
+
+# Uploads (path, open_file) pairs with at most STORAGE_UPLOAD_WORKERS in
+# flight. open_file is called by the worker and returns a File with a
+# content_type, so only the files being uploaded are open at a time.
+# Returns the error of every path that failed.
+@metrics.timed("storage")
+def upload_batch(uploads):
+    storage = get_storage()
+
+    def upload(item):
+        path, open_file = item
+        try:
+            with open_file() as file:
+                storage.upload(
+                    path,
+                    file.chunks(settings.STORAGE_CHUNK_SIZE),
+                    file.size,
+                    file.content_type,
+                )
+        except Exception as e:
+            return path, str(e)
+        return path, None
+
+    workers = max(1, min(settings.STORAGE_UPLOAD_WORKERS, len(uploads)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return {path: error for path, error in executor.map(upload, uploads) if error}
+
+
+# Storage cleanup jobs
+#
+# Jobs are run by jobs_worker (the storage_cleanup task of main/jobs.py) and
+# claimed by flipping them to "running"; a job whose runner died is
+# reclaimed once it has not reported progress for STALE_JOB_AFTER. Progress
+# is saved after every batch, so a reclaimed job resumes where it stopped.
+STALE_JOB_AFTER = timedelta(minutes=10)
+
+
+def create_cleanup_job(folders, description, customer=None):
+    return models.StorageCleanupJob.objects.create(
+        customer=customer, description=description, folders=folders
+    )
+
+
+def claim_cleanup_job(job_id):
+    stale = timezone.now() - STALE_JOB_AFTER
+    return bool(
+        models.StorageCleanupJob.objects.filter(id=job_id)
+        .filter(Q(status="pending") | Q(status="running", updated_at__lt=stale))
+        .update(status="running", updated_at=timezone.now())
+    )
+
+
+def run_cleanup_job(job_id):
+    if not claim_cleanup_job(job_id):
+        return False
+
+    job = models.StorageCleanupJob.objects.get(id=job_id)
+    batch_size = settings.STORAGE_CLEANUP_BATCH_SIZE
+    try:
+        while job.processed < job.total:
+            batch = job.folders[job.processed : job.processed + batch_size]
+            delete_folders(batch)
+            job.processed += len(batch)
+            job.save(update_fields=["processed", "updated_at"])
+        job.status = "done"
+        job.save(update_fields=["status", "updated_at"])
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+        job.save(update_fields=["status", "error", "updated_at"])
+    return True
+
+
+def pending_cleanup_jobs():
+    stale = timezone.now() - STALE_JOB_AFTER
+    return models.StorageCleanupJob.objects.filter(
+        Q(status="pending") | Q(status="running", updated_at__lt=stale)
+    ).order_by("id")
@@ -1,3 +1,1055 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import hashlib
+import io
+import json
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import authentication, cache, imports, jobs, models, stats, storage
+from .authentication import get_tokens, principals
+from .links import Link, LinkChecker
+
+
+def image(name, size=100):
+    return SimpleUploadedFile(name, b"\x89PNG" + b"x" * size, content_type="image/png")
+
+
+# Local storage with uploads refused for paths containing any of fail
+class FakeStorage(storage.LocalStorage):
+    def __init__(self, root, base_url, fail=()):
+        super().__init__(root, base_url)
+        self.fail = fail
+
+    def upload(self, path, chunks, size, content_type):
+        if any(name in path for name in self.fail):
+            raise ValueError("Upload refused")
+        super().upload(path, chunks, size, content_type)
+
+
+# Installs a FakeStorage on a temporary directory as the storage backend
+class FakeStorageMixin:
+    def setUp(self):
+        super().setUp()
+        self.root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.storage = FakeStorage(self.root, "http://testserver/media")
+        patcher = mock.patch.object(storage, "_storage", self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stored(self, folder):
+        return sorted(path.name for path in (self.root / folder).glob("*"))
+
+
+# Storage
+class UploadFilesTests(FakeStorageMixin, SimpleTestCase):
+    def test_uploads_every_file(self):
+        files = [image(f"{name}.png") for name in "abcd"]
+        urls = storage.upload_files(files, "products", 1)
+        self.assertEqual(
+            urls,
+            [
+                f"http://testserver/media/products/1/{i}_{n}.png"
+                for i, n in enumerate("abcd")
+            ],
+        )
+        self.assertEqual(
+            self.stored("products/1"), ["0_a.png", "1_b.png", "2_c.png", "3_d.png"]
+        )
+        self.assertEqual(
+            (self.root / "products/1/0_a.png").read_bytes()[:4], b"\x89PNG"
+        )
+
+    def test_failed_upload_removes_the_others(self):
+        self.storage.fail = ["2_c.png"]
+        files = [image(f"{name}.png") for name in "abcd"]
+        with self.assertRaisesMessage(ValueError, "Failed to upload image 'c.png'"):
+            storage.upload_files(files, "products", 1)
+        self.assertEqual(self.stored("products/1"), [])
+
+    @override_settings(STORAGE_MAX_UPLOAD_SIZE=50)
+    def test_oversized_file_uploads_nothing(self):
+        with self.assertRaisesMessage(ValueError, "exceeds the maximum size"):
+            storage.upload_files([image("a.png", 10), image("b.png")], "brands", 1)
+        self.assertFalse((self.root / "brands").exists())
+
+    def test_delete_folders(self):
+        storage.upload_files([image("a.png")], "products", 1)
+        storage.upload_files([image("b.png")], "products", 2)
+        storage.delete_folders(["products/1/", "products/2/"])
+        self.assertEqual(self.stored("products/1") + self.stored("products/2"), [])
+
+
+# Local HTTP stand-in for the link checker: /ok answers 200, /missing 404,
+# /flaky 503 until its second request and /slow answers after a second
+class LinkHandler(BaseHTTPRequestHandler):
+    hits = {}
+
+    def do_HEAD(self):
+        self.hits[self.path] = self.hits.get(self.path, 0) + 1
+        if self.path == "/slow":
+            time.sleep(1)
+        status = {"/ok": 200, "/slow": 200, "/flaky": 503}.get(self.path, 404)
+        if self.path == "/flaky" and self.hits[self.path] > 1:
+            status = 200
+        self.send_response(status)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class LinkCheckerTests(SimpleTestCase):
+    def setUp(self):
+        LinkHandler.hits = {}
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), LinkHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def check(self, urls, **kwargs):
+        async def links():
+            for url in urls:
+                yield Link(url, "static")
+
+        checker = LinkChecker(backoff=0.01, **kwargs)
+        results = asyncio.run(checker.run(links()))
+        return {result.link.url: result for result in results}
+
+    def test_statuses(self):
+        ok, missing = f"{self.base_url}/ok", f"{self.base_url}/missing"
+        results = self.check([ok, missing] * 5, concurrency=3)
+        self.assertEqual(len(results), 2)
+        self.assertTrue(results[ok].ok)
+        self.assertEqual(results[missing].status, 404)
+        self.assertFalse(results[missing].ok)
+
+    def test_retries_server_errors(self):
+        result = self.check([f"{self.base_url}/flaky"], retries=2)[
+            f"{self.base_url}/flaky"
+        ]
+        self.assertEqual((result.status, result.attempts), (200, 2))
+
+    def test_timeout_is_an_error(self):
+        url = f"{self.base_url}/slow"
+        result = self.check([url], timeout=0.2, retries=0)[url]
+        self.assertIsNone(result.status)
+        self.assertTrue(result.error)
+
+    def test_malformed_urls_do_not_stall_the_run(self):
+        urls = ["http://[::1", "http://exa mple.com/\x00", f"{self.base_url}/ok"] * 4
+        results = self.check(urls, concurrency=2, retries=0)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(results[f"{self.base_url}/ok"].ok)
+        self.assertIsNone(results["http://[::1"].status)
+
+
+# Catalog shared by the API tests: one vendor with a brand, a category and
+# twelve products with distinct names and prices
+class CatalogMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("vendor", "vendor@example.com", "secret123")
+        cls.customer = models.Customer.objects.create(user=cls.user, image="")
+        cls.category = models.Category.objects.create(
+            name="Ceramics", slug="ceramics", image=""
+        )
+        cls.brand = models.Brand.objects.create(
+            vendor=cls.customer, name="Kiln", slug="kiln", description="", image=""
+        )
+        cls.products = models.Product.objects.bulk_create(
+            [
+                models.Product(
+                    vendor=cls.customer,
+                    brand=cls.brand,
+                    category=cls.category,
+                    name=f"Glazed bowl {i:02}",
+                    description="A bowl",
+                    slug=f"glazed-bowl-{i:02}",
+                    price=Decimal(10 + (i * 7) % 12),
+                    details=[{"title": "Material", "value": "clay"}],
+                    images=[f"http://testserver/media/{i}/{n}.png" for n in range(4)],
+                )
+                for i in range(12)
+            ]
+        )
+
+    def setUp(self):
+        super().setUp()
+        caches["responses"].clear()
+
+    def login(self, user=None, customer=None):
+        user = user or self.user
+        customer = customer or self.customer
+        token = get_tokens(user, customer).access_token
+        self.client.cookies["access_token"] = str(token)
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+# Keyset pagination
+class KeysetPaginationTests(CatalogMixin, TestCase):
+    def pages(self, params):
+        response = self.client.get("/api/products", params)
+        pages = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append([product["slug"] for product in response.json()["results"]])
+            if response.json()["next"] is None:
+                return pages
+            response = self.client.get(response.json()["next"])
+
+    def test_cursor_round_trip(self):
+        pages = self.pages({"page_size": 5, "sortby": "price_lth"})
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        expected = [
+            product.slug
+            for product in sorted(self.products, key=lambda p: (p.price, p.id))
+        ]
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_descending_ordering(self):
+        pages = self.pages({"page_size": 4, "sortby": "price_htl"})
+        expected = [
+            product.slug
+            for product in sorted(self.products, key=lambda p: (-p.price, -p.id))
+        ]
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_unpaginated_list(self):
+        response = self.client.get("/api/products")
+        self.assertEqual(len(response.json()), 12)
+
+    def test_invalid_cursors(self):
+        cursors = {
+            "garbage": ("", "!!!"),
+            "wrong length": ("", encode_cursor([1, 2, 3])),
+            "null": ("", encode_cursor([None])),
+            "null price": ("price_lth", encode_cursor([None, 1])),
+            "bad date": ("latest", encode_cursor(["yesterday", 1])),
+            "bad id": ("", encode_cursor(["one"])),
+        }
+        for name, (sortby, cursor) in cursors.items():
+            with self.subTest(name):
+                response = self.client.get(
+                    "/api/products", {"cursor": cursor, "sortby": sortby}
+                )
+                self.assertEqual(response.status_code, 404)
+
+    def test_invalid_search_rank_cursor(self):
+        response = self.client.get(
+            "/api/products",
+            {"search": "bowl", "cursor": encode_cursor(["high", 1])},
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+# Shuffled lists
+class ShuffledListTests(CatalogMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        models.Category.objects.bulk_create(
+            [
+                models.Category(name=f"Craft {i:02}", slug=f"craft-{i:02}", image="")
+                for i in range(15)
+            ]
+        )
+
+    def shuffled(self, seed):
+        return [
+            slug
+            for _, slug in sorted(
+                (hashlib.md5(f"{id}:{seed}".encode()).hexdigest(), slug)
+                for id, slug in models.Category.objects.values_list("id", "slug")
+            )
+        ]
+
+    def pages(self, params):
+        response = self.client.get("/api/categories", params)
+        slugs = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            slugs += [category["slug"] for category in response.json()["results"]]
+            if response.json()["next"] is None:
+                return slugs
+            response = self.client.get(response.json()["next"])
+
+    def test_same_seed_same_order(self):
+        expected = self.shuffled("spring")
+        self.assertEqual(self.pages({"seed": "spring", "page_size": 4}), expected)
+        # Computed again, not served from the response cache
+        caches["responses"].clear()
+        self.assertEqual(self.pages({"seed": "spring", "page_size": 7}), expected)
+        response = self.client.get("/api/categories", {"seed": "spring"})
+        self.assertEqual([category["slug"] for category in response.json()], expected)
+
+    def test_other_seed_other_order(self):
+        spring = self.pages({"seed": "spring", "page_size": 4})
+        autumn = self.pages({"seed": "autumn", "page_size": 4})
+        self.assertEqual(autumn, self.shuffled("autumn"))
+        self.assertNotEqual(autumn, spring)
+        self.assertEqual(sorted(autumn), sorted(spring))
+
+    def test_limit(self):
+        response = self.client.get(
+            "/api/categories", {"seed": "spring", "limit": 5, "page_size": 2}
+        )
+        self.assertEqual(
+            [category["slug"] for category in response.json()],
+            self.shuffled("spring")[:5],
+        )
+
+
+# Principal cache
+class PrincipalCacheTests(CatalogMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        principals.clear()
+        self.addCleanup(principals.clear)
+        self.login()
+        self.token = self.client.cookies["access_token"].value
+
+    def get_profile(self, token=None):
+        if token is not None:
+            self.client.cookies["access_token"] = token
+        return self.client.get("/api/profile")
+
+    def test_cached_principal(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_profile().status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.get_profile()
+        self.assertEqual(response.json()["user"]["username"], "vendor")
+
+    def test_version_bump_revokes_cached_principal(self):
+        self.assertEqual(self.get_profile().status_code, 200)
+        response = self.client.post("/api/profile", {"password": "secret456!"})
+        self.assertEqual(response.status_code, 200)
+        renewed = response.cookies["access_token"].value
+
+        response = self.get_profile(self.token)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("Token has been revoked", response.json()["detail"])
+        self.assertEqual(self.get_profile(renewed).status_code, 200)
+
+    def test_bump_elsewhere_applies_after_ttl(self):
+        self.assertEqual(self.get_profile().status_code, 200)
+        # Another process bumping the version cannot reach this cache
+        models.Customer.objects.filter(id=self.customer.id).update(
+            token_version=F("token_version") + 1
+        )
+        self.assertEqual(self.get_profile().status_code, 200)
+        later = time.monotonic() + principals.ttl + 1
+        with mock.patch.object(authentication.time, "monotonic", return_value=later):
+            self.assertEqual(self.get_profile().status_code, 401)
+
+
+# Token claims
+class ValidateUserTests(CatalogMixin, TestCase):
+    def validate(self, token):
+        self.client.cookies["access_token"] = str(token)
+        return self.client.get("/api/validate-user")
+
+    def test_reads_the_username_claim(self):
+        token = get_tokens(self.user, self.customer).access_token
+        self.assertEqual(
+            (token["username"], token["customer_id"], token["ver"]),
+            ("vendor", self.customer.id, 1),
+        )
+        with self.assertNumQueries(0):
+            response = self.validate(token)
+        self.assertEqual(response.json(), {"message": "success", "username": "vendor"})
+
+    def test_tokens_without_claims(self):
+        token = RefreshToken.for_user(self.user).access_token
+        with self.assertNumQueries(1):
+            response = self.validate(token)
+        self.assertEqual(response.json()["username"], "vendor")
+
+        other = User.objects.create_user("gone", "gone@example.com", "secret123")
+        token = RefreshToken.for_user(other).access_token
+        other.delete()
+        self.assertEqual(self.validate(token).status_code, 404)
+        self.assertEqual(self.validate("not-a-token").status_code, 401)
+
+    def test_revoked_token(self):
+        token = get_tokens(self.user, self.customer).access_token
+        self.client.cookies["access_token"] = str(token)
+        response = self.client.post("/api/profile", {"username": "potter"})
+        self.assertEqual(response.status_code, 200)
+        renewed = response.cookies["access_token"].value
+        self.assertEqual(
+            self.validate(renewed).json(), {"message": "success", "username": "potter"}
+        )
+
+        # The stale token still decodes, as validate_user reads no rows, but
+        # every authenticated endpoint refuses it
+        self.assertEqual(self.validate(token).json()["username"], "vendor")
+        self.assertEqual(self.client.get("/api/profile").status_code, 401)
+
+
+# Review likes
+class ReviewLikeTests(CatalogMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.review = models.Review.objects.create(
+            product=self.products[0], review_by="vendor", rating=5, review="Lovely"
+        )
+        self.login()
+
+    def like(self, review_id=None):
+        return self.client.get("/api/review/like", {"id": review_id or self.review.id})
+
+    def test_toggle(self):
+        response = self.like()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["message"], "Like added")
+        self.assertEqual(response.json()["likes"], [self.customer.id])
+        self.assertEqual(response.json()["like_count"], 1)
+
+        response = self.like()
+        self.assertEqual(response.json()["message"], "Like removed")
+        self.assertEqual(response.json()["likes"], [])
+        self.assertEqual(response.json()["like_count"], 0)
+        self.review.refresh_from_db()
+        self.assertEqual(self.review.like_count, 0)
+
+    def test_likes_of_several_customers(self):
+        other = models.Customer.objects.create(
+            user=User.objects.create_user("buyer", "buyer@example.com", "secret123"),
+            image="",
+        )
+        models.ReviewLike.objects.create(review=self.review, customer=other)
+        models.Review.objects.filter(id=self.review.id).update(like_count=1)
+        response = self.like()
+        self.assertEqual(response.json()["like_count"], 2)
+        self.assertCountEqual(response.json()["likes"], [self.customer.id, other.id])
+
+    def test_missing_review(self):
+        self.assertEqual(self.like(review_id=10**9).status_code, 404)
+        self.assertIsNone(models.ReviewLike.toggle(10**9, self.customer.id))
+        self.assertFalse(models.ReviewLike.objects.exists())
+
+
+# Brand stats
+class BrandStatsTests(FakeStorageMixin, CatalogMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        stats.rebuild_brand_stats()
+        self.login()
+
+    def brand_stats(self):
+        row = models.BrandStats.objects.get(brand=self.brand)
+        return row.product_count, row.review_count, row.rating_sum
+
+    # The incremental updates must agree with a rebuild from scratch
+    def assertStats(self, expected):
+        self.assertEqual(self.brand_stats(), expected)
+        stats.rebuild_brand_stats(brand_ids=[self.brand.id])
+        self.assertEqual(self.brand_stats(), expected)
+
+    def post_review(self, product, rating):
+        response = self.client.post(
+            "/api/review",
+            {"product_id": product.id, "review": "Lovely glaze", "rating": rating},
+        )
+        self.assertEqual(response.status_code, 201)
+        return models.Review.objects.filter(product=product).latest("id")
+
+    def test_products_and_reviews(self):
+        response = self.client.post(
+            "/api/product",
+            {
+                "name": "Tall vase",
+                "description": "A vase",
+                "brand": self.brand.id,
+                "category": self.category.id,
+                "price": "40",
+                "discount": "0",
+                "details": json.dumps([{"title": "Material", "value": "clay"}]),
+                **{f"image{i}": image(f"{i}.png") for i in range(4)},
+            },
+        )
+        self.assertEqual(response.status_code, 201)
+        vase = models.Product.objects.get(slug="tall-vase")
+        self.assertStats((13, 0, 0))
+
+        self.post_review(vase, 5)
+        self.post_review(vase, 3)
+        review = self.post_review(self.products[0], 4)
+        self.assertStats((13, 3, 12))
+
+        response = self.client.delete(f"/api/review?id={review.id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertStats((13, 2, 8))
+
+        # Its reviews go with the product
+        response = self.client.delete(f"/api/product?id={vase.id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertStats((12, 0, 0))
+
+    def test_delete_review_of_another_user(self):
+        review = models.Review.objects.create(
+            product=self.products[0], review_by="someone", rating=5, review="Nice"
+        )
+        response = self.client.delete(f"/api/review?id={review.id}")
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(models.Review.objects.filter(id=review.id).exists())
+        self.assertEqual(self.client.delete("/api/review?id=0").status_code, 404)
+
+    def test_rebuild_command(self):
+        models.Review.objects.create(
+            product=self.products[0], review_by="someone", rating=5, review="Nice"
+        )
+        models.BrandStats.objects.filter(brand=self.brand).update(
+            product_count=0, review_count=0, rating_sum=0
+        )
+        # A brand from before the stats existed has no row
+        other = models.Brand.objects.create(
+            vendor=self.customer, name="Wheel", slug="wheel", description="", image=""
+        )
+        out = io.StringIO()
+        call_command("rebuild_brand_stats", stdout=out)
+        self.assertIn("Rebuilt stats for 2 brands.", out.getvalue())
+        self.assertEqual(self.brand_stats(), (12, 1, 5))
+        self.assertEqual(models.BrandStats.objects.get(brand=other).product_count, 0)
+
+
+# Product rating summary
+class RatingSummaryTests(CatalogMixin, TestCase):
+    def rating(self, product):
+        response = self.client.get("/api/product", {"slug": product.slug})
+        return response.json()["rating"]
+
+    def histogram(self, *counts):
+        return {str(star): count for star, count in enumerate(counts, start=1)}
+
+    def test_follows_posted_and_deleted_reviews(self):
+        self.login()
+        product = self.products[0]
+        for rating in (5, 4, 4):
+            response = self.client.post(
+                "/api/review",
+                {"product_id": product.id, "review": "Lovely", "rating": rating},
+            )
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            self.rating(product),
+            {
+                "average": 13 / 3,
+                "count": 3,
+                "histogram": self.histogram(0, 0, 0, 2, 1),
+            },
+        )
+
+        review = models.Review.objects.filter(product=product, rating=4).first()
+        response = self.client.delete(f"/api/review?id={review.id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.rating(product),
+            {"average": 4.5, "count": 2, "histogram": self.histogram(0, 0, 0, 1, 1)},
+        )
+
+        # Cards carry the summary too
+        card = next(
+            card
+            for card in self.client.get("/api/products").json()
+            if card["id"] == product.id
+        )
+        self.assertEqual((card["rating_avg"], card["rating_count"]), (4.5, 2))
+
+    def test_rating_sorts(self):
+        for i, product in enumerate(self.products):
+            models.Product.objects.filter(id=product.id).update(
+                rating_avg=(i * 5) % 4 + 1.5, rating_count=(i * 7) % 5
+            )
+        products = list(models.Product.objects.order_by("id"))
+        for sortby, key in (
+            ("rating", lambda p: (-p.rating_avg, -p.id)),
+            ("most_reviewed", lambda p: (-p.rating_count, -p.id)),
+        ):
+            with self.subTest(sortby=sortby):
+                slugs = []
+                response = self.client.get(
+                    "/api/products", {"sortby": sortby, "page_size": 5}
+                )
+                while True:
+                    slugs += [card["slug"] for card in response.json()["results"]]
+                    if response.json()["next"] is None:
+                        break
+                    response = self.client.get(response.json()["next"])
+                self.assertEqual(
+                    slugs, [product.slug for product in sorted(products, key=key)]
+                )
+
+
+# Response cache
+class ResponseCacheTests(CatalogMixin, TestCase):
+    def get_product(self):
+        return self.client.get("/api/product", {"slug": self.products[0].slug})
+
+    def test_hit_after_miss(self):
+        self.assertEqual(self.get_product()["X-Cache"], "MISS")
+        # Only the versions are read on a hit
+        with self.assertNumQueries(1):
+            response = self.get_product()
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.json()["slug"], self.products[0].slug)
+
+    def test_bump_invalidates(self):
+        self.get_product()
+        models.Product.objects.filter(id=self.products[0].id).update(name="Renamed")
+        cache.bump("product")
+        response = self.get_product()
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["name"], "Renamed")
+
+    def test_unrelated_bump_keeps_entries(self):
+        self.get_product()
+        cache.bump("category")
+        self.assertEqual(self.get_product()["X-Cache"], "HIT")
+
+
+# Conditional GET
+class ConditionalGetTests(CatalogMixin, TestCase):
+    def get_categories(self, **headers):
+        return self.client.get("/api/categories", headers=headers)
+
+    def set_last_modified(self, value):
+        cache.bump("category")
+        models.CacheVersion.objects.filter(name="category").update(updated_at=value)
+
+    def test_etag(self):
+        response = self.get_categories()
+        etag = response["ETag"]
+        self.assertEqual(self.get_categories(if_none_match=etag).status_code, 304)
+        self.assertEqual(self.get_categories(if_none_match="*").status_code, 304)
+
+        cache.bump("category")
+        response = self.get_categories(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_if_modified_since(self):
+        cache.bump("category")
+        last_modified = self.get_categories()["Last-Modified"]
+        response = self.get_categories(if_modified_since=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        # An older date, and a later write than the date sent
+        earlier = http_date(time.time() - 3600)
+        response = self.get_categories(if_modified_since=earlier)
+        self.assertEqual(response.status_code, 200)
+        self.set_last_modified(timezone.now() + timedelta(seconds=5))
+        response = self.get_categories(if_modified_since=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_none_match_takes_precedence(self):
+        self.set_last_modified(datetime(2026, 1, 1, tzinfo=dt_timezone.utc))
+        response = self.get_categories(
+            if_none_match='W/"stale"', if_modified_since=http_date(time.time())
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+@jobs.task("test_echo")
+def echo(payloads):
+    return [payload.get("error") for payload in payloads]
+
+
+# Job queue
+class JobQueueTests(TransactionTestCase):
+    def test_claim_skips_locked_jobs(self):
+        queued = [jobs.enqueue("test_echo", {}) for _ in range(3)]
+        locked, release = threading.Event(), threading.Event()
+
+        # Another worker holding the first job
+        def hold():
+            try:
+                with transaction.atomic():
+                    models.Job.objects.select_for_update().get(id=queued[0].id)
+                    locked.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        self.assertTrue(locked.wait(5))
+        try:
+            claimed = jobs.claim(10)
+        finally:
+            release.set()
+            holder.join()
+
+        self.assertEqual([job.id for job in claimed], [job.id for job in queued[1:]])
+        self.assertEqual(jobs.claim(10), [queued[0]])
+        self.assertEqual(jobs.claim(10), [])
+
+    def test_claimed_jobs_are_running(self):
+        job = jobs.enqueue("test_echo", {})
+        (claimed,) = jobs.claim(10)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("running", 1))
+        self.assertEqual((claimed.status, claimed.attempts), ("running", 1))
+
+    @override_settings(JOB_RETRY_DELAY=30)
+    def test_retries_then_dead_letters(self):
+        job = jobs.enqueue("test_echo", {"error": "boom"}, max_attempts=2)
+        jobs.work()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), ("queued", 1, "boom"))
+        self.assertGreater(job.run_at, timezone.now())
+
+        models.Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        jobs.work()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("dead", 2))
+
+    def test_done_and_unknown_tasks(self):
+        done = jobs.enqueue("test_echo", {})
+        unknown = jobs.enqueue("missing", {})
+        jobs.work()
+        done.refresh_from_db()
+        unknown.refresh_from_db()
+        self.assertEqual(done.status, "done")
+        self.assertEqual(unknown.status, "dead")
+
+    def test_task_filters(self):
+        echo = jobs.enqueue("test_echo", {})
+        crawl = jobs.enqueue("link_analysis", {"run_id": 1})
+        self.assertEqual(jobs.claim(10, exclude=["link_analysis"]), [echo])
+        self.assertEqual(jobs.claim(10, tasks=["test_echo"]), [])
+        self.assertEqual(jobs.claim(10, tasks=["link_analysis"]), [crawl])
+
+    @override_settings(JOB_LOCK_TIMEOUT=600)
+    def test_touch_keeps_the_lock(self):
+        touched = jobs.enqueue("link_analysis", {"run_id": 1})
+        stale = jobs.enqueue("link_analysis", {"run_id": 2})
+        jobs.claim(10)
+        models.Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+
+        touch = async_to_sync(jobs.atouch)
+        self.assertEqual(touch("link_analysis", run_id=1), 1)
+        self.assertEqual(jobs.requeue_stale(), 1)
+        touched.refresh_from_db()
+        stale.refresh_from_db()
+        self.assertEqual((touched.status, stale.status), ("running", "queued"))
+
+
+def product_row(name, **fields):
+    return {
+        "name": name,
+        "description": "Imported",
+        "brand": "kiln",
+        "category": "ceramics",
+        "price": "25",
+        "details": [{"title": "Material", "value": "clay"}],
+        "images": ["a.png", "b.png", "c.png", "d.png"],
+        **fields,
+    }
+
+
+# Bulk product import
+class ImportTests(FakeStorageMixin, CatalogMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.setUpTestData()
+        other = models.Customer.objects.create(
+            user=User.objects.create_user("other", "other@example.com", "secret123"),
+            image="",
+        )
+        models.Brand.objects.create(
+            vendor=other, name="Other", slug="other", description="", image=""
+        )
+        self.images = [image(name) for name in ("a.png", "b.png", "c.png", "d.png")]
+
+    def run_import(self, rows, **kwargs):
+        data = "\n".join(json.dumps(row) for row in rows)
+        return imports.import_products(
+            list(imports.read_rows(data, "jsonl")),
+            self.customer,
+            imports.uploaded_images(self.images),
+            **kwargs,
+        )
+
+    def test_upload_batch(self):
+        opener = imports.uploaded_images(self.images)("a.png")
+        self.storage.fail = ["refused"]
+        errors = storage.upload_batch(
+            [("products/1/0_a.png", opener), ("products/1/refused.png", opener)]
+        )
+        self.assertEqual(errors, {"products/1/refused.png": "Upload refused"})
+        self.assertEqual(self.stored("products/1"), ["0_a.png"])
+
+    def test_report(self):
+        report = self.run_import(
+            [
+                product_row("Imported bowl", tags="bowl|clay"),
+                product_row("Missing description", description=""),
+                product_row("Foreign brand", brand="other"),
+                product_row("Glazed bowl 00"),
+                product_row("Missing image", images="a.png|b.png|c.png|x.png"),
+                product_row("Imported bowl"),
+                product_row("Imported vase", brand=str(self.brand.id), discount="10"),
+            ]
+        )
+        self.assertEqual(
+            [entry["status"] for entry in report],
+            [
+                "created",
+                "invalid",
+                "invalid",
+                "invalid",
+                "invalid",
+                "invalid",
+                "created",
+            ],
+        )
+        self.assertEqual(report[1]["errors"], ["description is required"])
+        self.assertEqual(report[2]["errors"], ["Brand 'other' not found"])
+        self.assertEqual(report[3]["errors"], ["Product with this name already exists"])
+        self.assertEqual(report[4]["errors"], ["Image 'x.png' not found"])
+        self.assertEqual(report[5]["errors"], ["Product with this name already exists"])
+
+        product = models.Product.objects.get(id=report[0]["id"])
+        self.assertEqual(product.slug, "imported-bowl")
+        self.assertEqual(
+            product.images,
+            [
+                f"http://testserver/media/products/{product.id}/{i}_{name}"
+                for i, name in enumerate(["a.png", "b.png", "c.png", "d.png"])
+            ],
+        )
+        self.assertEqual(
+            sorted(product.tags.values_list("name", flat=True)), ["bowl", "clay"]
+        )
+        self.assertIsNotNone(product.search_vector)
+        self.assertEqual(
+            self.stored(f"products/{product.id}"),
+            ["0_a.png", "1_b.png", "2_c.png", "3_d.png"],
+        )
+        self.assertEqual(
+            models.BrandStats.objects.get(brand=self.brand).product_count, 14
+        )
+        self.assertEqual(
+            imports.summarize(report),
+            {"created": 2, "valid": 0, "invalid": 5, "failed": 0},
+        )
+
+    def test_cell_types(self):
+        report = self.run_import(
+            [
+                product_row(1234567, price=30),
+                product_row("Object description", description={"text": "Bowl"}),
+                product_row("Listed brand", brand=["kiln"]),
+            ]
+        )
+        self.assertEqual(
+            [entry["status"] for entry in report], ["created", "invalid", "invalid"]
+        )
+        self.assertEqual(report[0]["slug"], "1234567")
+        self.assertEqual(
+            report[1]["errors"],
+            ["description must be text", "description is required"],
+        )
+        self.assertEqual(
+            report[2]["errors"], ["brand must be text", "brand is required"]
+        )
+
+    def test_decimal_limits(self):
+        report = self.run_import(
+            [
+                product_row("Not a number", price="NaN"),
+                product_row("Infinite price", price="Infinity"),
+                product_row("Huge price", price="1e20"),
+                product_row("Fine price", price="12.345"),
+                product_row("Huge discount", discount="1e5"),
+                product_row("Priced bowl", price="99.99", discount=12.5),
+            ]
+        )
+        self.assertEqual(
+            [entry["status"] for entry in report],
+            ["invalid"] * 5 + ["created"],
+        )
+        self.assertEqual(report[0]["errors"], ["price must be a number"])
+        self.assertEqual(report[1]["errors"], ["price must be a number"])
+        limits = (
+            "price must have at most 10 digits before the decimal point and 2 after"
+        )
+        self.assertEqual(report[2]["errors"], [limits])
+        self.assertEqual(report[3]["errors"], [limits])
+        self.assertEqual(
+            report[4]["errors"],
+            [
+                "discount must have at most 3 digits before the decimal point and 2 after"
+            ],
+        )
+        product = models.Product.objects.get(slug="priced-bowl")
+        self.assertEqual(
+            (product.price, product.discount), (Decimal("99.99"), Decimal("12.5"))
+        )
+
+    def test_failed_upload_removes_the_row(self):
+        self.images.append(image("refused.png"))
+        self.storage.fail = ["refused"]
+        in_transaction = []
+        upload_batch = storage.upload_batch
+
+        def record(uploads):
+            in_transaction.append(connection.in_atomic_block)
+            # Nothing of the batch is listed while its images upload
+            self.assertFalse(
+                models.Product.objects.filter(
+                    slug__in=["refused-bowl", "accepted-bowl"]
+                ).exists()
+            )
+            return upload_batch(uploads)
+
+        with mock.patch.object(storage, "upload_batch", record):
+            report = self.run_import(
+                [
+                    product_row("Refused bowl", images="a.png|b.png|refused.png|d.png"),
+                    product_row("Accepted bowl"),
+                ]
+            )
+
+        self.assertEqual(in_transaction, [False])
+        self.assertEqual(report[0]["status"], "failed")
+        self.assertEqual(
+            report[0]["errors"],
+            ["Failed to upload image 'refused.png': Upload refused"],
+        )
+        self.assertEqual(report[1]["status"], "created")
+        self.assertFalse(models.Product.objects.filter(slug="refused-bowl").exists())
+        self.assertTrue(models.Product.objects.filter(slug="accepted-bowl").exists())
+        stored = {path.parent.name for path in (self.root / "products").glob("*/*")}
+        self.assertEqual(stored, {str(report[1]["id"])})
+
+    def test_digit_slugs(self):
+        numbered = models.Brand.objects.create(
+            vendor=self.customer,
+            name="Numbered",
+            slug=str(self.brand.id),
+            description="",
+            image="",
+        )
+        report = self.run_import(
+            [
+                product_row("Numbered bowl", brand=numbered.slug),
+                product_row("Kiln bowl", brand="kiln"),
+                product_row("Long number", brand="9" * 30),
+            ]
+        )
+        self.assertEqual(
+            [entry["status"] for entry in report], ["created", "created", "invalid"]
+        )
+        self.assertEqual(
+            models.Product.objects.get(slug="numbered-bowl").brand_id, numbered.id
+        )
+        self.assertEqual(report[2]["errors"], [f"Brand '{'9' * 30}' not found"])
+
+    def test_dry_run(self):
+        report = self.run_import([product_row("Imported bowl")], dry_run=True)
+        self.assertEqual(
+            report, [{"row": 1, "status": "valid", "slug": "imported-bowl"}]
+        )
+        self.assertFalse(models.Product.objects.filter(slug="imported-bowl").exists())
+        self.assertFalse((self.root / "products").exists())
+
+    def test_endpoint(self):
+        self.login()
+        data = "\n".join(
+            json.dumps(product_row(f"Endpoint bowl {i}")) for i in range(2)
+        )
+        response = self.client.post(
+            "/api/products/import",
+            {
+                "file": SimpleUploadedFile("rows.jsonl", data.encode()),
+                "images": self.images,
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["summary"],
+            {"created": 2, "valid": 0, "invalid": 0, "failed": 0},
+        )
+
+
+# Catalog export
+@override_settings(EXPORT_CHUNK_SIZE=5)
+class ExportTests(CatalogMixin, TestCase):
+    def export(self, **params):
+        response = self.client.get("/api/products", params)
+        body = b"".join(response.streaming_content).decode()
+        return response, body
+
+    def test_ndjson(self):
+        response, body = self.export(export="ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(
+            [row["slug"] for row in rows], [product.slug for product in self.products]
+        )
+        self.assertEqual(
+            set(rows[0]),
+            {
+                "id",
+                "name",
+                "slug",
+                "price",
+                "discount",
+                "image",
+                "rating_avg",
+                "rating_count",
+                "brand_name",
+            },
+        )
+
+    def test_csv(self):
+        response, body = self.export(export="csv", fields="name,price,details,images")
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(list(rows[0]), ["name", "price", "details", "images"])
+        self.assertEqual(rows[0]["images"], "|".join(self.products[0].images))
+        self.assertEqual(json.loads(rows[0]["details"]), self.products[0].details)
+
+    def test_filters(self):
+        _, body = self.export(export="ndjson", max_price="12", sortby="price_lth")
+        prices = [Decimal(json.loads(line)["price"]) for line in body.splitlines()]
+        expected = sorted(p.price for p in self.products if p.price <= 12)
+        self.assertEqual(prices, expected)
+
+        _, body = self.export(export="ndjson", category="missing")
+        self.assertEqual(body, "")
+
+    def test_unsupported_format(self):
+        response = self.client.get("/api/products", {"export": "xml"})
+        self.assertEqual(response.status_code, 400)
@@ -1,5 +1,6 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 from rest_framework import routers
 
 router = routers.DefaultRouter()
@@ -13,6 +14,7 @@ urlpatterns = [
     # App
     path("product", views.ProductView.as_view(), name="product-detail"),
     path("products", views.ProductListView.as_view(), name="product-list"),
+    path("products/import", views.import_products, name="product-import"),
     path("brand", views.BrandView.as_view(), name="brand-detail"),
     path("brands", views.BrandListView.as_view(), name="brand-list"),
     path("categories", views.CategoryListView.as_view(), name="category-list"),
@@ -22,12 +24,57 @@ urlpatterns = [
     path("profile", views.ProfileView.as_view(), name="profile"),
     path("myproducts", views.MyProductsView.as_view(), name="myproducts"),
     path("mybrands", views.MyBrandsView.as_view(), name="mybrands"),
+    path(
+        "storage-cleanup",
+        views.storage_cleanup_status,
+        name="storage-cleanup-status",
+    ),
     # slugs
     path("brand/slugs", views.brand_slugs, name="brands-slug-list"),
     path("product/slugs", views.product_slugs, name="products-slug-list"),
     path("category/slugs", views.category_slugs, name="categories-slug-list"),
+    # sitemaps
+    path("sitemap.xml", views.sitemap_index, name="sitemap-index"),
+    path(
+        "sitemap-<str:section>-<int:page>.xml",
+        views.sitemap_section,
+        name="sitemap-section",
+    ),
     # cron
     path("run_link_analysis", views.run_link_analysis, name="rarecraft-link-analysis"),
+    path(
+        "link-analysis/status",
+        views.link_analysis_status,
+        name="link-analysis-status",
+    ),
+    path("link-analysis/broken", views.broken_links, name="broken-links"),
 ]
 
 urlpatterns += router.urls
+
+# Under ASGI the public reads are served by native async views
+if settings.ASYNC_VIEWS:
+    async_urlpatterns = {
+        "product-detail": async_views.async_reads(
+            async_views.product_detail, views.ProductView.as_view()
+        ),
+        "product-list": async_views.product_list,
+        "brand-detail": async_views.async_reads(
+            async_views.brand_detail, views.BrandView.as_view()
+        ),
+        "brand-list": async_views.brand_list,
+        "category-list": async_views.category_list,
+        "products-slug-list": async_views.product_slugs,
+        "brands-slug-list": async_views.brand_slugs,
+        "categories-slug-list": async_views.category_slugs,
+    }
+    urlpatterns = [
+        (
+            path(
+                str(pattern.pattern), async_urlpatterns[pattern.name], name=pattern.name
+            )
+            if pattern.name in async_urlpatterns
+            else pattern
+        )
+        for pattern in urlpatterns
+    ]
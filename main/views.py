@@ -1,63 +1,45 @@
 from rest_framework import generics
 from . import serializers
 from . import models
+from . import pagination
+from . import cache
+from .authentication import USERNAME_CLAIM, get_customer, get_tokens, principals
+from . import documents
+from . import exports
+from . import imports
+from . import jobs
+from . import links
+from . import search
+from . import sitemaps
+from . import stats
+from . import storage
 from django.contrib.auth.models import User
-from rest_framework.permissions import AllowAny
-from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework.response import Response
 from rest_framework import status
-from django.core.mail import send_mail, BadHeaderError
 from django.conf import settings
 from decouple import config
 from django.contrib.auth import authenticate, get_user_model
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.password_validation import validate_password
-from rest_framework.decorators import permission_classes, api_view
-from django.db import IntegrityError
+from rest_framework.decorators import (
+    api_view,
+    authentication_classes,
+    permission_classes,
+)
+from django.db import IntegrityError, transaction
 from rest_framework.views import APIView
-from django.db.models import Q
+from django.db.models import CharField, F, Value
+from django.db.models.functions import MD5, Cast, Concat
 from django.utils.text import slugify
-from supabase import create_client, Client
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.http import StreamingHttpResponse
+from django.urls import reverse
 import json
-from random import choice, shuffle
-from django.core.management import call_command
-
-# Initialize Supabase client
-SUPABASE_URL = config("SUPABASE_URL")
-SUPABASE_KEY = config("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-
-def upload_supabase(files, folder_type, id):
-    public_urls = []
-
-    for index, file in enumerate(files):
-        folder_path = f"{folder_type}/{id}/{index}_{file.name}"
-
-        response = supabase.storage.from_("assets").upload(
-            file=file.read(),
-            path=folder_path,
-            file_options={"content-type": file.content_type},
-        )
-        if response.is_error:
-            raise ValueError(
-                f"Failed to upload image '{file.name}' to Supabase: {response['error']['message']}"
-            )
-
-        public_url = supabase.storage.from_("assets").get_public_url(folder_path)
-        public_urls.append(public_url)
-
-    return public_urls
-
-
-def delete_supabase(folder_type, id):
-    folder_path = f"{folder_type}/{id}/"
-    response = supabase.storage.from_("assets").list(folder_path)
-
-    for file_info in response:
-        file_name = file_info["name"]
-        supabase.storage.from_("assets").remove([f"{folder_path}{file_name}"])
+from random import choice
 
 
 @api_view(["POST"])
@@ -90,19 +72,16 @@ def register(request):
             user=user, image="https://cdn-icons-png.flaticon.com/128/236/236831.png"
         )
         try:
-            send_mail(
+            jobs.send_mail(
                 "Registration Successful!",
                 "Welcome to RareCraft. Thank you for registering with us.",
                 settings.EMAIL_HOST_USER,
                 [email],
-                fail_silently=False,
             )
-        except BadHeaderError:
-            print("Invalid header found.")
         except Exception as e:
-            print(f"Failed to send email: {e}")
+            print(f"Failed to queue email: {e}")
 
-        refresh = RefreshToken.for_user(user)
+        refresh = get_tokens(user, customer)
         response = Response(
             {"message": "Success", "customer_id": customer.id}, status=201
         )
@@ -134,7 +113,8 @@ def login(request):
         username = user.username
         user = authenticate(username=username, password=password)
         if user:
-            refresh = RefreshToken.for_user(user)
+            customer = models.Customer.objects.filter(user=user).order_by("id").first()
+            refresh = get_tokens(user, customer)
             response = Response(
                 {"message": "Success", "username": user.username}, status=200
             )
@@ -173,12 +153,17 @@ def logout(request):
 
 @api_view(["GET"])
 @permission_classes([AllowAny])
+@authentication_classes([])
 def validate_user(request):
     token = request.COOKIES.get("access_token")
     if not token:
         return Response({"message": "No access token"}, status=401)
     try:
         validated_token = AccessToken(token)
+        username = validated_token.get(USERNAME_CLAIM)
+        if username is not None:
+            return Response({"message": "success", "username": username}, status=200)
+        # tokens issued before the username claim
         user_id = validated_token["user_id"]
         try:
             user = User.objects.get(id=user_id)
@@ -194,7 +179,7 @@ def validate_user(request):
 class ProfileView(APIView):
     def get(self, request):
         try:
-            customer = models.Customer.objects.get(user=request.user)
+            customer = get_customer(request)
             serializer = serializers.CustomerSerializer(customer)
             return Response(serializer.data, status=200)
         except models.Customer.DoesNotExist:
@@ -204,8 +189,7 @@ class ProfileView(APIView):
 
     def post(self, request):
         try:
-            customer = models.Customer.objects.get(user=request.user)
-            user = customer.user
+            customer = get_customer(request)
             data = request.data.copy()
             if "email" in data:
                 data.pop("email")
@@ -226,83 +210,302 @@ class ProfileView(APIView):
                         status=400,
                     )
 
-            # Update username, mobile, and image
-            serializer = serializers.CustomerSerializer(
-                customer, data=data, partial=True
-            )
-            if serializer.is_valid():
+            # The principal cache may be stale: the rows are reloaded and
+            # locked so a save cannot undo another session's changes
+            with transaction.atomic():
+                customer = (
+                    models.Customer.objects.select_for_update()
+                    .select_related("user")
+                    .get(id=customer.id)
+                )
+                user = customer.user
+
+                # Update username, mobile, and image
+                serializer = serializers.CustomerSerializer(
+                    customer, data=data, partial=True
+                )
+                if not serializer.is_valid():
+                    return Response(serializer.errors, status=400)
                 serializer.save()
 
                 if username:
                     user.username = username
-                    user.save()
                 if password:
                     user.set_password(password)
-                    user.save()
+                if username or password:
+                    user.save(
+                        update_fields=(["username"] if username else [])
+                        + (["password"] if password else [])
+                    )
+                    # revokes other sessions' tokens, this one gets a new token
+                    models.Customer.objects.filter(id=customer.id).update(
+                        token_version=F("token_version") + 1
+                    )
+                    customer.refresh_from_db(fields=["token_version"])
+            principals.invalidate_user(user.id)
 
-                return Response(
-                    {"message": "Profile updated successfully."}, status=200
+            response = Response(
+                {"message": "Profile updated successfully."}, status=200
+            )
+            if username or password:
+                response.set_cookie(
+                    key="access_token",
+                    value=str(get_tokens(user, customer).access_token),
+                    httponly=True,
+                    secure=True,
+                    samesite="None",
+                    max_age=604800,
                 )
-            return Response(serializer.errors, status=400)
+            return response
         except models.Customer.DoesNotExist:
             return Response({"message": "Profile not found."}, status=404)
         except Exception as e:
             return Response({"message": str(e)}, status=500)
 
 
-class MyProductsView(generics.ListAPIView):
-    serializer_class = serializers.ProductSerializer
+# Sparse fieldsets for product lists
+#
+# Without parameters products are rendered as compact cards. ?fields= picks
+# ProductSerializer fields and ?expand= adds the nested brand, category, tags
+# and reviews; ?expand=brand,category,tags,reviews gives the full product.
+# Only the selected columns are loaded and only expanded relations are joined
+# or prefetched.
+class ProductFieldsMixin:
+    card_columns = [
+        "id",
+        "name",
+        "slug",
+        "price",
+        "discount",
+        "images",
+        "rating_avg",
+        "rating_count",
+        "brand__name",
+    ]
+    field_columns = {
+        "id": ["id"],
+        "name": ["name"],
+        "description": ["description"],
+        "content": ["content"],
+        "slug": ["slug"],
+        "price": ["price"],
+        "discount": ["discount"],
+        "details": ["details"],
+        "images": ["images"],
+        "created_at": ["created_at"],
+        "rating": ["rating_avg", "rating_count", "rating_histogram"],
+    }
+    expandable = ["brand", "category", "tags", "reviews"]
+
+    def get_query_list(self, param):
+        value = self.request.query_params.get(param, "")
+        return [name.strip() for name in value.split(",") if name.strip()]
+
+    def get_field_selection(self):
+        fields = self.get_query_list("fields")
+        expand = self.get_query_list("expand")
+        if not fields and not expand:
+            return None
+        fields = [name for name in fields if name in self.field_columns]
+        expand = [name for name in expand if name in self.expandable]
+        return fields or list(self.field_columns), expand
+
+    def get_serializer_class(self):
+        if self.get_field_selection() is None:
+            return serializers.ProductCardSerializer
+        return serializers.ProductSerializer
+
+    def get_serializer(self, *args, **kwargs):
+        selection = self.get_field_selection()
+        if selection is not None:
+            fields, expand = selection
+            kwargs["fields"] = fields + expand
+        return super().get_serializer(*args, **kwargs)
+
+    def select_product_fields(self, queryset, extra_columns=()):
+        selection = self.get_field_selection()
+        if selection is None:
+            return queryset.select_related("brand").only(
+                *self.card_columns, *extra_columns
+            )
 
+        fields, expand = selection
+        columns = ["id", *extra_columns]
+        for name in fields:
+            columns += self.field_columns[name]
+        if "brand" in expand:
+            queryset = queryset.select_related("brand__stats")
+            columns.append("brand")
+        if "category" in expand:
+            queryset = queryset.select_related("category")
+            columns.append("category")
+        if "tags" in expand:
+            queryset = queryset.prefetch_related("tags")
+        if "reviews" in expand:
+            queryset = queryset.prefetch_related("reviews__likes")
+        return queryset.only(*columns)
+
+
+class MyProductsView(ProductFieldsMixin, generics.ListAPIView):
     def get_queryset(self):
-        return models.Product.objects.filter(vendor__user=self.request.user)
+        queryset = models.Product.objects.filter(vendor__user=self.request.user)
+        return self.select_product_fields(queryset)
 
 
 class MyBrandsView(generics.ListAPIView):
     serializer_class = serializers.BrandSerializer
 
     def get_queryset(self):
-        return models.Brand.objects.filter(vendor__user=self.request.user)
+        return models.Brand.objects.filter(
+            vendor__user=self.request.user
+        ).select_related("stats")
+
+
+# ListModelMixin.list for the async views (main/async_views.py): the same
+# queryset, pagination and serializer, evaluated with the async ORM
+class AsyncListMixin:
+    async def alist(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data).data
+        serializer = self.get_serializer([obj async for obj in queryset], many=True)
+        return serializer.data
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        return await self.paginator.apaginate_queryset(
+            queryset, self.request, view=self
+        )
 
 
-class CategoryListView(generics.ListAPIView):
-    permission_classes = [AllowAny]
-    queryset = models.Category.objects.all()
+def shuffle_seed(request):
+    return request.GET.get("seed") or timezone.now().date().isoformat()
+
+
+# Random order computed in the database: rows are sorted by md5(id:seed), so
+# a seed always gives the same order, which can be keyset paginated and
+# cached per seed. Without ?seed= the order changes daily; ?limit= returns
+# only the first rows, e.g. for carousels.
+class ShuffledListMixin:
+    pagination_class = pagination.KeysetPagination
+
+    def get_ordering(self):
+        return ("shuffle_key", "id")
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.query_params["limit"])
+        except (KeyError, ValueError):
+            return None
+        return limit if limit > 0 else None
 
     def get_queryset(self):
-        queryset = list(models.Category.objects.all())
-        shuffle(queryset)
-        return queryset
+        seed = shuffle_seed(self.request)
+        queryset = (
+            super()
+            .get_queryset()
+            .annotate(
+                shuffle_key=MD5(Concat(Cast("id", CharField()), Value(f":{seed}")))
+            )
+            .order_by(*self.get_ordering())
+        )
+        limit = self.get_limit()
+        return queryset[:limit] if limit else queryset
 
-    serializer_class = serializers.CategorySerializer
+    def paginate_queryset(self, queryset):
+        if self.get_limit():
+            return None
+        return super().paginate_queryset(queryset)
 
+    async def apaginate_queryset(self, queryset):
+        if self.get_limit():
+            return None
+        return await super().apaginate_queryset(queryset)
 
-class BrandListView(generics.ListAPIView):
+
+class CategoryListView(ShuffledListMixin, AsyncListMixin, generics.ListAPIView):
     permission_classes = [AllowAny]
-    queryset = models.Brand.objects.all()
+    queryset = models.Category.objects.all()
+    serializer_class = serializers.CategorySerializer
+
+    @cache.cache_response("category", vary=shuffle_seed)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
-    def get_queryset(self):
-        queryset = list(models.Brand.objects.all())
-        shuffle(queryset)
-        return queryset
 
+class BrandListView(ShuffledListMixin, AsyncListMixin, generics.ListAPIView):
+    permission_classes = [AllowAny]
+    queryset = models.Brand.objects.select_related("stats")
     serializer_class = serializers.BrandSerializer
 
+    @cache.cache_response("brand", vary=shuffle_seed)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 
-class ProductListView(generics.ListAPIView):
+class ProductListView(ProductFieldsMixin, AsyncListMixin, generics.ListAPIView):
     permission_classes = [AllowAny]
-    serializer_class = serializers.ProductSerializer
+    pagination_class = pagination.KeysetPagination
+    orderings = {
+        "alphabetic": ("name", "id"),
+        "price_htl": ("-price", "-id"),
+        "price_lth": ("price", "id"),
+        "latest": ("-created_at", "-id"),
+        "rating": ("-rating_avg", "-id"),
+        "most_reviewed": ("-rating_count", "-id"),
+    }
+
+    @cache.cache_response("product", store=False)
+    def list(self, request, *args, **kwargs):
+        if "export" in request.query_params:
+            try:
+                return self.export(exports.iter_export)
+            except ValueError as e:
+                return Response({"message": str(e)}, status=400)
+        return super().list(request, *args, **kwargs)
+
+    # ?export=ndjson or ?export=csv streams every product matching the
+    # filters, unpaginated, with the fields picked by ?fields= and ?expand=
+    # (main/exports.py)
+    def export(self, iter_export):
+        export_format = exports.get_format(self.request.query_params["export"])
+        columns = list(self.get_serializer().fields)
+
+        def serialize(products):
+            return self.get_serializer(products, many=True).data
+
+        response = StreamingHttpResponse(
+            iter_export(
+                self.get_queryset(),
+                serialize,
+                columns,
+                export_format,
+                chunk_size=settings.EXPORT_CHUNK_SIZE,
+            ),
+            content_type=exports.FORMATS[export_format],
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="products.{export_format}"'
+        )
+        return response
 
     # filters
     def get_queryset(self):
-        queryset = (
-            models.Product.objects.select_related("category", "brand")
-            .prefetch_related("tags")
-            .all()
+        ordering = self.get_ordering()
+        queryset = self.select_product_fields(
+            models.Product.objects.all(),
+            # keyset pagination reads the ordering columns of the last row
+            extra_columns=[
+                name.lstrip("-") for name in ordering if name != "-search_rank"
+            ],
         )
 
         if "search" in self.request.GET and self.request.GET["search"]:
             search_query = self.request.GET["search"]
-            queryset = queryset.filter(Q(name__icontains=search_query))
+            queryset = search.search_products(queryset, search_query)
 
         if "tag" in self.request.GET and self.request.GET["tag"]:
             tag = self.request.GET["tag"]
@@ -324,18 +527,16 @@ class ProductListView(generics.ListAPIView):
             max_price = self.request.GET["max_price"]
             queryset = queryset.filter(price__lte=max_price)
 
-        if "sortby" in self.request.GET and self.request.GET["sortby"]:
-            sort_by = self.request.GET["sortby"]
-            if sort_by == "alphabetic":
-                queryset = queryset.order_by("name")
-            elif sort_by == "price_htl":
-                queryset = queryset.order_by("-price")
-            elif sort_by == "price_lth":
-                queryset = queryset.order_by("price")
-            elif sort_by == "latest":
-                queryset = queryset.order_by("-created_at")
+        return queryset.order_by(*ordering)
 
-        return queryset
+    # sorting, always ending in a unique tie-breaker for keyset pagination
+    def get_ordering(self):
+        sort_by = self.request.GET.get("sortby")
+        if sort_by in self.orderings:
+            return self.orderings[sort_by]
+        if self.request.GET.get("search"):
+            return ("-search_rank", "-id")
+        return ("id",)
 
 
 class ProductView(APIView):
@@ -344,16 +545,15 @@ class ProductView(APIView):
             return [AllowAny()]
         return super().get_permissions()
 
+    @cache.cache_response("product")
     def get(self, request):
         slug = request.query_params.get("slug")
         if not slug:
             return Response({"message": "Slug is required"}, status=400)
-        try:
-            product = models.Product.objects.get(slug=slug)
-            serializer = serializers.ProductSerializer(product)
-            return Response(serializer.data, status=200)
-        except models.Product.DoesNotExist:
+        product = documents.product_detail(slug)
+        if product is None:
             return Response({"message": "Product not found"}, status=404)
+        return Response(product, status=200)
 
     def post(self, request):
         name = request.data.get("name")
@@ -419,7 +619,7 @@ class ProductView(APIView):
             return Response({"message": "Brand not found"}, status=400)
 
         try:
-            customer = models.Customer.objects.get(user=request.user)
+            customer = get_customer(request)
         except models.Customer.DoesNotExist:
             return Response({"message": "Customer profile not found"}, status=403)
 
@@ -441,11 +641,12 @@ class ProductView(APIView):
 
         # Upload the images to Supabase
         try:
-            image_urls = upload_supabase(
+            image_urls = storage.upload_files(
                 [image0, image1, image2, image3], "products", product.id
             )
             product.images = image_urls
             product.save()
+            stats.product_added(product)
         except ValueError as e:
             product.delete()
             return Response({"message": str(e)}, status=500)
@@ -464,6 +665,10 @@ class ProductView(APIView):
         except Exception as e:
             print(f"Failed to select or add tag: {str(e)}")
 
+        search.update_search_vectors(models.Product.objects.filter(id=product.id))
+
+        cache.bump("product", "brand")
+
         return Response({"message": "Product Created Successfully"}, status=201)
 
     def put(self, request):
@@ -538,7 +743,7 @@ class ProductView(APIView):
             return Response({"message": "Brand not found"}, status=400)
 
         try:
-            customer = models.Customer.objects.get(user=request.user)
+            customer = get_customer(request)
         except models.Customer.DoesNotExist:
             return Response({"message": "Customer profile not found"}, status=403)
 
@@ -550,8 +755,8 @@ class ProductView(APIView):
 
         if image0 and image1 and image2 and image3:
             try:
-                delete_supabase("products", product.id)
-                image_urls = upload_supabase(
+                storage.delete_folder("products", product.id)
+                image_urls = storage.upload_files(
                     [image0, image1, image2, image3], "products", product.id
                 )
                 product.images = image_urls
@@ -566,6 +771,7 @@ class ProductView(APIView):
                 )
 
         try:
+            old_brand_id = product.brand_id
             product.name = name
             product.description = description
             product.content = content
@@ -574,10 +780,16 @@ class ProductView(APIView):
             product.price = price
             product.discount = discount
             product.details = json.loads(details)
-            product.save()
+            with transaction.atomic():
+                product.save()
+                stats.product_moved(product, old_brand_id)
+                search.update_search_vectors(
+                    models.Product.objects.filter(id=product.id)
+                )
         except Exception as e:
             return Response({"message": str(e)}, status=500)
 
+        cache.bump("product", "brand")
         return Response({"message": "Product Updated Successfully"}, status=200)
 
     def delete(self, request):
@@ -590,7 +802,7 @@ class ProductView(APIView):
             return Response({"message": "Product not found"}, status=404)
 
         try:
-            customer = models.Customer.objects.get(user=request.user)
+            customer = get_customer(request)
         except models.Customer.DoesNotExist:
             return Response({"message": "Customer profile not found"}, status=403)
 
@@ -601,8 +813,11 @@ class ProductView(APIView):
             )
 
         try:
-            delete_supabase("products", product.id)
-            product.delete()
+            storage.delete_folder("products", product.id)
+            with transaction.atomic():
+                stats.product_removed(product)
+                product.delete()
+            cache.bump("product", "brand")
             return Response({"message": "Product deleted successfully"}, status=200)
         except Exception as e:
             return Response(
@@ -611,18 +826,59 @@ class ProductView(APIView):
             )
 
 
+# Bulk product import
+#
+# A CSV or JSONL "file" of products (main/imports.py) with their images as
+# "images" files or in a zip "archive". Answers with a report per row;
+# dry_run only validates.
+@api_view(["POST"])
+def import_products(request):
+    upload = request.FILES.get("file")
+    if upload is None:
+        return Response({"message": "File is required"}, status=400)
+    file_format = request.data.get("format") or upload.name.rsplit(".", 1)[-1].lower()
+
+    try:
+        customer = get_customer(request)
+    except models.Customer.DoesNotExist:
+        return Response({"message": "Customer profile not found"}, status=403)
+
+    try:
+        rows = list(imports.read_rows(upload.read(), file_format))
+        if "archive" in request.FILES:
+            open_image = imports.archive_images(request.FILES["archive"])
+        else:
+            open_image = imports.uploaded_images(request.FILES.getlist("images"))
+    except ValueError as e:
+        return Response({"message": str(e)}, status=400)
+    if not rows:
+        return Response({"message": "The file has no rows"}, status=400)
+    if len(rows) > settings.IMPORT_MAX_ROWS:
+        return Response(
+            {"message": f"At most {settings.IMPORT_MAX_ROWS} rows per import"},
+            status=400,
+        )
+
+    dry_run = str(request.data.get("dry_run", "")).lower() in ("1", "true")
+    report = imports.import_products(rows, customer, open_image, dry_run=dry_run)
+    return Response(
+        {"summary": imports.summarize(report), "results": report}, status=200
+    )
+
+
 class BrandView(APIView):
     def get_permissions(self):
         if self.request.method == "GET":
             return [AllowAny()]
         return super().get_permissions()
 
+    @cache.cache_response("brand")
     def get(self, request):
         slug = request.query_params.get("slug")
         if not slug:
             return Response({"message": "Slug is required"}, status=400)
         try:
-            brand = models.Brand.objects.get(slug=slug)
+            brand = models.Brand.objects.select_related("stats").get(slug=slug)
             serializer = serializers.BrandSerializer(brand)
             return Response(serializer.data, status=200)
         except models.Brand.DoesNotExist:
@@ -651,24 +907,26 @@ class BrandView(APIView):
             )
 
         try:
-            customer = models.Customer.objects.get(user=request.user)
+            customer = get_customer(request)
         except models.Customer.DoesNotExist:
             return Response({"message": "Customer profile not found"}, status=403)
 
         try:
-            brand = models.Brand.objects.create(
-                vendor=customer,
-                name=name,
-                slug=slug,
-                description=description,
-                image="https://cdn-icons-png.flaticon.com/512/16895/16895417.png",
-            )
+            with transaction.atomic():
+                brand = models.Brand.objects.create(
+                    vendor=customer,
+                    name=name,
+                    slug=slug,
+                    description=description,
+                    image="https://cdn-icons-png.flaticon.com/512/16895/16895417.png",
+                )
+                models.BrandStats.objects.create(brand=brand)
         except Exception as e:
             return Response({"message": str(e)}, status=500)
 
         # Upload the image to Supabase
         try:
-            image_urls = upload_supabase([image_file], "brands", brand.id)
+            image_urls = storage.upload_files([image_file], "brands", brand.id)
             brand.image = image_urls[0]
             brand.save()
         except ValueError as e:
@@ -681,6 +939,7 @@ class BrandView(APIView):
                 status=500,
             )
 
+        cache.bump("brand")
         return Response({"message": "Brand Created Successfully"}, status=201)
 
     def put(self, request):
@@ -692,7 +951,7 @@ class BrandView(APIView):
         except models.Brand.DoesNotExist:
             return Response({"message": "Brand not found"}, status=404)
 
-        if brand.vendor.user != request.user:
+        if brand.vendor.user_id != request.user.id:
             return Response(
                 {"message": "You do not have permission to update this brand"},
                 status=403,
@@ -720,8 +979,8 @@ class BrandView(APIView):
             brand.description = description
         if image_file:
             try:
-                delete_supabase("brands", brand.id)
-                image_urls = upload_supabase([image_file], "brands", brand.id)
+                storage.delete_folder("brands", brand.id)
+                image_urls = storage.upload_files([image_file], "brands", brand.id)
                 brand.image = image_urls[0]
             except ValueError as e:
                 return Response({"message": str(e)}, status=500)
@@ -733,7 +992,11 @@ class BrandView(APIView):
                     status=500,
                 )
 
-        brand.save()
+        with transaction.atomic():
+            brand.save()
+            if name:
+                search.update_search_vectors(models.Product.objects.filter(brand=brand))
+        cache.bump("brand", "product")
         return Response({"message": "Brand Updated Successfully"}, status=200)
 
     def delete(self, request):
@@ -746,7 +1009,7 @@ class BrandView(APIView):
             return Response({"message": "Brand not found"}, status=404)
 
         try:
-            customer = models.Customer.objects.get(user=request.user)
+            customer = get_customer(request)
         except models.Customer.DoesNotExist:
             return Response({"message": "Customer profile not found"}, status=403)
 
@@ -756,14 +1019,27 @@ class BrandView(APIView):
                 status=403,
             )
 
+        # Delete the rows now and let jobs_worker remove their images
         try:
-            delete_supabase("brands", brand.id)
-            products = models.Product.objects.filter(brand=brand)
-            for product in products:
-                delete_supabase("products", product.id)
-            brand.delete()
+            product_ids = models.Product.objects.filter(brand=brand).values_list(
+                "id", flat=True
+            )
+            folders = [storage.folder_path("brands", brand.id)] + [
+                storage.folder_path("products", product_id)
+                for product_id in product_ids
+            ]
+            with transaction.atomic():
+                job = storage.create_cleanup_job(
+                    folders, f"Brand {brand.slug}", customer=customer
+                )
+                brand.delete()
+                jobs.enqueue("storage_cleanup", {"job_id": job.id})
+            cache.bump("brand", "product")
             return Response(
-                {"message": "Brand and associated products deleted successfully"},
+                {
+                    "message": "Brand and associated products deleted successfully",
+                    "cleanup_job": job.id,
+                },
                 status=200,
             )
         except Exception as e:
@@ -774,6 +1050,29 @@ class BrandView(APIView):
 
 
 class ReviewView(APIView):
+    orderings = {
+        "helpful": ("-like_count", "-id"),
+        "latest": ("-created_at", "-id"),
+    }
+
+    def get_permissions(self):
+        if self.request.method == "GET":
+            return [AllowAny()]
+        return super().get_permissions()
+
+    def get(self, request):
+        product_id = request.query_params.get("product_id")
+        if not product_id:
+            return Response({"message": "Product ID is required"}, status=400)
+        ordering = self.orderings.get(request.query_params.get("sortby"), ("id",))
+        reviews = (
+            models.Review.objects.filter(product_id=product_id)
+            .prefetch_related("likes")
+            .order_by(*ordering)
+        )
+        serializer = serializers.ReviewSerializer(reviews, many=True)
+        return Response(serializer.data, status=200)
+
     def post(self, request):
         product_id = request.data.get("product_id")
         review = request.data.get("review")
@@ -784,6 +1083,8 @@ class ReviewView(APIView):
             product = models.Product.objects.get(id=product_id)
         except models.Product.DoesNotExist:
             return Response({"message": "Invalid product ID"}, status=404)
+        if str(rating) not in ("1", "2", "3", "4", "5"):
+            return Response({"message": "Rating must be between 1 and 5"}, status=400)
 
         review_data = {
             "product": product.id,
@@ -794,8 +1095,13 @@ class ReviewView(APIView):
         serializer = serializers.ReviewSerializer(data=review_data)
 
         if serializer.is_valid():
-            serializer.save()
-            updated_reviews = models.Review.objects.filter(product=product)
+            with transaction.atomic():
+                review = serializer.save()
+                stats.review_added(review, product)
+            cache.bump("product", "brand")
+            updated_reviews = models.Review.objects.filter(
+                product=product
+            ).prefetch_related("likes")
             reviews_serializer = serializers.ReviewSerializer(
                 updated_reviews, many=True
             )
@@ -809,6 +1115,32 @@ class ReviewView(APIView):
 
         return Response(serializer.errors, status=400)
 
+    def delete(self, request):
+        review_id = request.query_params.get("id")
+        if not review_id:
+            return Response({"message": "Review ID is required"}, status=400)
+
+        with transaction.atomic():
+            # Locked, so a concurrent delete of the same review is not
+            # counted twice
+            review = (
+                models.Review.objects.select_for_update()
+                .select_related("product")
+                .filter(id=review_id)
+                .first()
+            )
+            if review is None:
+                return Response({"message": "Review not found"}, status=404)
+            if review.review_by != request.user.username:
+                return Response(
+                    {"message": "You do not have permission to delete this review"},
+                    status=403,
+                )
+            review.delete()
+            stats.review_removed(review, review.product)
+        cache.bump("product", "brand")
+        return Response({"message": "Review deleted successfully"}, status=200)
+
 
 @api_view(["GET"])
 def like_review(request):
@@ -816,58 +1148,145 @@ def like_review(request):
     if not review_id:
         return Response({"message": "Review ID is required"}, status=400)
 
-    try:
-        review = models.Review.objects.get(id=review_id)
-    except models.Review.DoesNotExist:
+    if not models.Review.objects.filter(id=review_id).exists():
         return Response({"message": "Review not found"}, status=404)
 
     try:
-        customer = models.Customer.objects.get(user=request.user)
+        customer = get_customer(request)
     except models.Customer.DoesNotExist:
         return Response({"message": "Customer not found"}, status=404)
 
-    customer_id = customer.id
-    if customer_id in review.likes:
-        review.likes.remove(customer_id)
-        message = "Like removed"
-    else:
-        review.likes.append(customer_id)
-        message = "Like added"
-    review.save()
+    toggled = models.ReviewLike.toggle(review_id, customer.id)
+    if toggled is None:
+        return Response({"message": "Review not found"}, status=404)
+    liked, like_count = toggled
+    cache.bump("product")
+    likes = models.ReviewLike.objects.filter(review_id=review_id).values_list(
+        "customer_id", flat=True
+    )
+
+    return Response(
+        {
+            "message": "Like added" if liked else "Like removed",
+            "likes": list(likes),
+            "like_count": like_count,
+        },
+        status=200,
+    )
+
+
+@api_view(["GET"])
+def storage_cleanup_status(request):
+    job_id = request.query_params.get("id")
+    if not job_id:
+        return Response({"message": "ID is required"}, status=400)
+    try:
+        job = models.StorageCleanupJob.objects.get(
+            id=job_id, customer__user=request.user
+        )
+    except models.StorageCleanupJob.DoesNotExist:
+        return Response({"message": "Job not found"}, status=404)
+
+    return Response(
+        {
+            "id": job.id,
+            "description": job.description,
+            "status": job.status,
+            "processed": job.processed,
+            "total": job.total,
+            "error": job.error,
+        },
+        status=200,
+    )
+
 
-    return Response({"message": message, "likes": review.likes}, status=200)
+# Slugs, or with ?since=<ISO 8601 datetime> only those changed after it
+def slugs_since(queryset, since):
+    if since:
+        since = parse_datetime(since)
+        if since is None:
+            raise ValueError("Invalid since")
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        queryset = queryset.filter(updated_at__gt=since)
+    return queryset.values_list("slug", flat=True)
+
+
+def list_slugs(request, queryset):
+    try:
+        slugs = slugs_since(queryset, request.query_params.get("since"))
+    except ValueError as e:
+        return Response({"message": str(e)}, status=400)
+    return Response(list(slugs))
 
 
 @api_view(["GET"])
 @permission_classes([AllowAny])
+@cache.cache_response("product")
 def product_slugs(request):
     try:
-        product_slugs = models.Product.objects.values_list("slug", flat=True)
-        return Response(list(product_slugs))
+        return list_slugs(request, models.Product.objects.all())
     except Exception as e:
         return Response([], status=404)
 
 
 @api_view(["GET"])
 @permission_classes([AllowAny])
+@cache.cache_response("brand")
 def brand_slugs(request):
     try:
-        brand_slugs = models.Brand.objects.values_list("slug", flat=True)
-        return Response(list(brand_slugs))
+        return list_slugs(request, models.Brand.objects.all())
     except Exception as e:
         return Response([], status=404)
 
 
 @api_view(["GET"])
 @permission_classes([AllowAny])
+@cache.cache_response("category")
 def category_slugs(request):
     try:
-        category_slugs = models.Category.objects.values_list("slug", flat=True)
-        return Response(list(category_slugs))
+        return list_slugs(request, models.Category.objects.all())
     except Exception as e:
         return Response([], status=404)
 
 
+def sitemap_response(chunks):
+    return StreamingHttpResponse(chunks, content_type="application/xml")
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+@cache.cache_response("product", "brand", "category", store=False)
+def sitemap_index(request):
+    def shard_url(name, page):
+        return request.build_absolute_uri(
+            reverse("sitemap-section", kwargs={"section": name, "page": page})
+        )
+
+    return sitemap_response(sitemaps.iter_index(shard_url))
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def sitemap_section(request, section, page):
+    if section == "static":
+        if page != 1:
+            return Response({"message": "Sitemap not found"}, status=404)
+        return sitemap_response(sitemaps.iter_static(settings.SITE_URL))
+
+    sitemap = sitemaps.SECTIONS.get(section)
+    if sitemap is None:
+        return Response({"message": "Sitemap not found"}, status=404)
+
+    @cache.cache_response(sitemap.namespace, store=False)
+    def shard(request):
+        if not sitemaps.shard_exists(sitemap, page):
+            return Response({"message": "Sitemap not found"}, status=404)
+        return sitemap_response(sitemaps.iter_shard(sitemap, page, settings.SITE_URL))
+
+    return shard(request)
+
+
 @api_view(["POST"])
 @permission_classes([AllowAny])
 def run_link_analysis(request):
@@ -876,8 +1295,64 @@ def run_link_analysis(request):
         return Response({"message": "CRON ID is required"}, status=400)
     try:
         if id == config("CRON_JOB_ID"):
-            call_command("link_analysis")
-            return Response({"message": "Link analysis started."}, status=200)
+            run, created = links.create_run(bool(request.data.get("incremental")))
+            if not created:
+                return Response(
+                    {"message": "Link analysis already in progress.", "job": run.id},
+                    status=409,
+                )
+            # One attempt: a run that failed is reported as failed, not retried
+            jobs.enqueue("link_analysis", {"run_id": run.id}, max_attempts=1)
+            return Response(
+                {"message": "Link analysis started.", "job": run.id}, status=202
+            )
         return Response({"message": "ID failed to match"}, status=400)
     except Exception as e:
         return Response({"message": "Error", "error": str(e)}, status=500)
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def link_analysis_status(request):
+    job_id = request.query_params.get("id")
+    if not job_id:
+        return Response({"message": "ID is required"}, status=400)
+    try:
+        run = models.LinkAnalysisRun.objects.get(id=job_id)
+    except (models.LinkAnalysisRun.DoesNotExist, ValueError):
+        return Response({"message": "Job not found"}, status=404)
+
+    return Response(
+        {
+            "id": run.id,
+            "status": run.status,
+            "incremental": run.incremental,
+            "checked": run.checked,
+            "total": run.total,
+            "broken": run.broken,
+            "eta": links.eta(run),
+            "started_at": run.started_at,
+            "finished_at": run.finished_at,
+            "error": run.error,
+        },
+        status=200,
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def broken_links(request):
+    queryset = links.broken_links()
+    kind = request.query_params.get("kind")
+    if kind:
+        queryset = queryset.filter(kind=kind)
+    serializer = serializers.LinkCheckSerializer(queryset, many=True)
+    last_run = links.last_run()
+    return Response(
+        {
+            "last_run": last_run.finished_at if last_run else None,
+            "count": len(serializer.data),
+            "results": serializer.data,
+        },
+        status=200,
+    )
@@ -59,9 +59,12 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
 ]
 
 MIDDLEWARE = [
+    "main.middleware.request_metrics",
+    "main.middleware.db_pool_metrics",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.security.SecurityMiddleware",
@@ -95,21 +98,133 @@ WSGI_APPLICATION = "rarecraft_backend.wsgi.application"
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+#
+# Connections come from a psycopg pool shared by the threads of a worker and
+# reused across requests. The pool checks a connection before handing it out
+# (CONN_HEALTH_CHECKS) and recycles connections older than
+# DB_POOL_MAX_LIFETIME seconds. Pooling requires CONN_MAX_AGE = 0. The
+# backend (main/backends/postgresql) records checkouts for the per-request
+# pool metrics of main.middleware.
+
+DB_POOL = config("DB_POOL", default=True, cast=bool)
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        "ENGINE": "main.backends.postgresql",
         "NAME": config("DB_NAME"),
         "USER": config("DB_USER"),
         "PASSWORD": config("DB_PASSWORD"),
         "HOST": config("DB_HOST", default="localhost"),
         "PORT": config("DB_PORT", default="5432"),
+        "CONN_MAX_AGE": 0,
+        "CONN_HEALTH_CHECKS": True,
         "OPTIONS": {
             "connect_timeout": 30,
         },
     }
 }
 
+if DB_POOL:
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": config("DB_POOL_MIN_SIZE", default=1, cast=int),
+        "max_size": config("DB_POOL_MAX_SIZE", default=10, cast=int),
+        "max_lifetime": config("DB_POOL_MAX_LIFETIME", default=1800, cast=float),
+        "max_idle": config("DB_POOL_MAX_IDLE", default=300, cast=float),
+        "timeout": config("DB_POOL_TIMEOUT", default=10, cast=float),
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+#
+# "responses" holds the public read endpoint cache (main/cache.py). Keys carry
+# database-backed versions, so any backend is safe to share between workers:
+# locmem (per process), filebased (LOCATION is a directory) or db (LOCATION
+# is a table created by `manage.py createcachetable`).
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "responses": {
+        "BACKEND": config(
+            "RESPONSE_CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": config("RESPONSE_CACHE_LOCATION", default="rarecraft-responses"),
+        "TIMEOUT": config("RESPONSE_CACHE_TIMEOUT", default=86400, cast=int),
+    },
+}
+
+
+# Serve the public read endpoints with the async views in main/async_views.py,
+# enabled by asgi.py
+
+ASYNC_VIEWS = config("ASYNC_VIEWS", default=False, cast=bool)
+
+
+# Request metrics (main.middleware.request_metrics): share of the requests
+# that get query, serializer and storage timings as Server-Timing headers,
+# and how often one query shape must run to be reported as an N+1
+
+METRICS_SAMPLE_RATE = config("METRICS_SAMPLE_RATE", default=0.05, cast=float)
+METRICS_N_PLUS_ONE_THRESHOLD = config(
+    "METRICS_N_PLUS_ONE_THRESHOLD", default=5, cast=int
+)
+
+
+# Public site: link analysis checks and sitemaps list its pages
+
+SITE_URL = config("SITE_URL", default="https://rarecraft.onrender.com")
+SITEMAP_MAX_URLS = 50000
+
+
+# Storage (main/storage.py)
+# "supabase" uploads to the Supabase Storage bucket, "local" writes to
+# STORAGE_LOCAL_ROOT and is meant for development and tests.
+
+STORAGE_BACKEND = config("STORAGE_BACKEND", default="supabase")
+STORAGE_BUCKET = config("STORAGE_BUCKET", default="assets")
+STORAGE_LOCAL_ROOT = config("STORAGE_LOCAL_ROOT", default=str(BASE_DIR / "media"))
+STORAGE_LOCAL_URL = config("STORAGE_LOCAL_URL", default="http://localhost:8000/media")
+STORAGE_UPLOAD_WORKERS = config("STORAGE_UPLOAD_WORKERS", default=4, cast=int)
+STORAGE_MAX_UPLOAD_SIZE = config(
+    "STORAGE_MAX_UPLOAD_SIZE", default=5 * 1024 * 1024, cast=int
+)
+STORAGE_CHUNK_SIZE = 64 * 1024
+STORAGE_REMOVE_BATCH_SIZE = 1000
+STORAGE_CLEANUP_BATCH_SIZE = 100
+
+SUPABASE_URL = config("SUPABASE_URL")
+SUPABASE_KEY = config("SUPABASE_KEY")
+
+
+# Bulk product import (main/imports.py): rows per insert transaction, and
+# the most rows the import endpoint accepts (the command has no limit)
+
+IMPORT_BATCH_SIZE = config("IMPORT_BATCH_SIZE", default=500, cast=int)
+IMPORT_MAX_ROWS = config("IMPORT_MAX_ROWS", default=1000, cast=int)
+
+
+# Catalog export (main/exports.py): products read from the server-side
+# cursor and serialized per chunk
+
+EXPORT_CHUNK_SIZE = config("EXPORT_CHUNK_SIZE", default=1000, cast=int)
+
+
+# Background jobs (main/jobs.py), processed by `manage.py jobs_worker`.
+# Failed jobs are retried after JOB_RETRY_DELAY seconds, doubled on every
+# attempt; running jobs not finished within JOB_LOCK_TIMEOUT are requeued.
+# Link analysis runs for minutes, so it gets a worker of its own:
+# `jobs_worker --task link_analysis` next to
+# `jobs_worker --exclude-task link_analysis`.
+
+JOB_BATCH_SIZE = config("JOB_BATCH_SIZE", default=50, cast=int)
+JOB_MAX_ATTEMPTS = config("JOB_MAX_ATTEMPTS", default=5, cast=int)
+JOB_RETRY_DELAY = config("JOB_RETRY_DELAY", default=30, cast=int)
+JOB_LOCK_TIMEOUT = config("JOB_LOCK_TIMEOUT", default=600, cast=int)
+JOB_POLL_INTERVAL = config("JOB_POLL_INTERVAL", default=2, cast=float)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -169,6 +284,11 @@ SIMPLE_JWT = {
     "BLACKLIST_AFTER_ROTATION": True,
 }
 
+# Seconds an authenticated user and customer stay cached per access token in
+# each process (main/authentication.py); 0 disables the cache.
+AUTH_PRINCIPAL_CACHE_TTL = config("AUTH_PRINCIPAL_CACHE_TTL", default=30, cast=int)
+AUTH_PRINCIPAL_CACHE_SIZE = 1024
+
 
 SESSION_COOKIE_SAMESITE = "None"
 SESSION_COOKIE_SECURE = True